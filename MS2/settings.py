@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 
 from pathlib import Path
 import datetime
+import os
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -47,13 +48,90 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework_simplejwt.authentication.JWTAuthentication',
     ),
+    'DEFAULT_RENDERER_CLASSES': (
+        'blogs.metrics.TimedJSONRenderer',
+        'blogs.metrics.TimedBrowsableAPIRenderer',
+    ),
+    'DEFAULT_THROTTLE_CLASSES': (
+        'blogs.throttling.AnonBucketThrottle',
+        'blogs.throttling.UserBucketThrottle',
+        'blogs.throttling.WriteBucketThrottle',
+        'blogs.throttling.EndpointBucketThrottle',
+    ),
+    'DEFAULT_THROTTLE_RATES': {
+        'anon': '60/min',
+        'user': '300/min',
+        'write': '60/min',  # лайки, комментарии, посты
+        'listing': '120/min',  # /api/posts/, /api/blogs/, /api/general/
+    },
 }
 
+# Хранилище токен-бакетов: MemoryBucketStore - в памяти процесса,
+# CacheBucketStore - общий для всех воркеров через кэш THROTTLE_CACHE (например, Redis)
+THROTTLE_BUCKET_STORE = 'blogs.throttling.MemoryBucketStore'
+
+# Метрики на /metrics (формат Prometheus): счётчики запросов и гистограммы времени
+# по имени URL с разбивкой на SQL, сериализацию и рендеринг.
+# METRICS_DIR - общий каталог, через который суммируются метрики всех воркеров
+# (очищайте его при перезапуске сервиса), METRICS_TOKEN - требовать "Authorization: Bearer <токен>"
+METRICS_ENABLED = True
+METRICS_DIR = os.environ.get('METRICS_DIR')
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+METRICS_FLUSH_INTERVAL = 5  # секунд между сбросами снимка воркера в METRICS_DIR
+
+# Профилирование запросов (по умолчанию выключено). Профиль (семплы стеков и SQL)
+# сохраняется для запросов дольше PROFILING_SLOW_THRESHOLD секунд, для доли
+# PROFILING_SAMPLE_RATE всех запросов и для запросов с подписанным заголовком
+# PROFILING_HEADER (значение выдаёт manage.py profiles sign).
+# Просмотр: manage.py profiles list / summary / diff
+PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED') == '1'
+PROFILING_SLOW_THRESHOLD = 1.0
+PROFILING_SAMPLE_RATE = 0.0
+PROFILING_HEADER = 'X-Profile'
+PROFILING_INTERVAL = 0.01  # период семплирования стеков, секунд
+PROFILING_DIR = os.environ.get('PROFILING_DIR', str(BASE_DIR / 'profiles'))
+PROFILING_MAX_FILES = 200
+PROFILING_MAX_BYTES = 50 * 1024 * 1024
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': datetime.timedelta(days=15),
     'REFRESH_TOKEN_LIFETIME': datetime.timedelta(days=15),
 }
+# Фоновые задачи, выполняются командой `python manage.py run_jobs`
+JOBS_EAGER = False  # True - выполнять задачи сразу после коммита, без воркера
+JOBS_MAX_ATTEMPTS = 5
+JOBS_RETRY_BACKOFF = 5  # секунды, удваивается с каждой попыткой
+JOBS_LOCK_TIMEOUT = 600
+JOBS_RETENTION_DAYS = 7  # выполненные и упавшие задачи удаляет python manage.py prune_jobs
+BLOG_SYNC_DELETE_MAX_POSTS = 100
+# rollup_stats не трогает строки моложе этого числа секунд: их соседи с меньшим id могут быть ещё не закоммичены
+STATS_ROLLUP_LAG = 300
+
+# Уведомления подписчиков
+NOTIFICATIONS_CHUNK_SIZE = 1000  # подписчиков в одной пачке рассылки
+NOTIFICATIONS_RETENTION_DAYS = 30  # python manage.py prune_notifications
+
+# Админка: до этого числа строк список считается точно, дальше - по оценке планировщика Postgres
+ADMIN_EXACT_COUNT_LIMIT = 10000
+
+# Кэш владельца и авторов блога для проверки прав. Алиас из CACHES, общий для всех воркеров
+# (например, Redis); без него права проверяются запросом к базе
+BLOG_MEMBERS_CACHE = None
+BLOG_MEMBERS_CACHE_TIMEOUT = 300
+
+# Кэш объектов Post/Blog по id: LRU в памяти процесса и, если указан алиас из CACHES, общий кэш
+OBJECT_CACHE_SIZE = 10000
+OBJECT_CACHE_TTL = 60
+OBJECT_CACHE_SHARED = None
+
+# Архивация лайков и комментариев: python manage.py archive_activity
+ARCHIVE_AFTER_DAYS = 365
+ARCHIVE_INACTIVE_POST_DAYS = None  # число дней - переносить всё по постам, опубликованным раньше
+ARCHIVE_BATCH_SIZE = 1000
+
 MIDDLEWARE = [
+    'blogs.metrics.MetricsMiddleware',  # первым, чтобы время запроса включало остальные middleware
+    'blogs.profiling.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -61,6 +139,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'blogs.throttling.RateLimitHeadersMiddleware',
 ]
 
 ROOT_URLCONF = 'MS2.urls'
@@ -99,6 +178,15 @@ DATABASES = {
     }
 }
 
+# Шардирование контента блогов: посты, комментарии и лайки блога лежат в базе
+# Blog.shard, пользователи и блоги - в 'default'. Новые блоги по очереди получают
+# шарды из BLOG_NEW_SHARDS (по умолчанию все BLOG_SHARDS). Для нескольких шардов
+# добавьте базы в DATABASES и их алиасы сюда, затем выполните
+# migrate --database=<алиас> для каждой
+BLOG_SHARDS = ['default']
+BLOG_NEW_SHARDS = None
+DATABASE_ROUTERS = ['blogs.sharding.BlogShardRouter']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -119,6 +207,32 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# Password hashing
+# Профиль выбирается переменной окружения PASSWORD_HASH_PROFILE: pbkdf2 (по умолчанию), argon2 (нужен argon2-cffi)
+# или scrypt. При входе пароли, захешированные другим профилем или стоимостью, перехешируются автоматически.
+PASSWORD_HASH_PROFILE = os.environ.get('PASSWORD_HASH_PROFILE', 'pbkdf2')
+PASSWORD_HASH_ITERATIONS = int(os.environ.get('PASSWORD_HASH_ITERATIONS', 600000))
+PASSWORD_HASH_ARGON2_TIME_COST = int(os.environ.get('PASSWORD_HASH_ARGON2_TIME_COST', 2))
+PASSWORD_HASH_ARGON2_MEMORY_COST = int(os.environ.get('PASSWORD_HASH_ARGON2_MEMORY_COST', 102400))
+PASSWORD_HASH_SCRYPT_WORK_FACTOR = int(os.environ.get('PASSWORD_HASH_SCRYPT_WORK_FACTOR', 2 ** 14))
+_PASSWORD_HASHERS = {
+    'pbkdf2': 'blogs.hashers.ConfigurablePBKDF2PasswordHasher',
+    'argon2': 'blogs.hashers.ConfigurableArgon2PasswordHasher',
+    'scrypt': 'blogs.hashers.ConfigurableScryptPasswordHasher',
+}
+PASSWORD_HASHERS = [_PASSWORD_HASHERS[PASSWORD_HASH_PROFILE]] + [
+    hasher for profile, hasher in _PASSWORD_HASHERS.items() if profile != PASSWORD_HASH_PROFILE
+] + [
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+]
+# Хеширование идёт в общем пуле потоков; если в очереди больше PASSWORD_HASH_MAX_PENDING запросов,
+# регистрация и /api/token/ отвечают 503, а не занимают все воркеры
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 0)) or None  # None - по числу ядер
+PASSWORD_HASH_MAX_PENDING = int(os.environ.get('PASSWORD_HASH_MAX_PENDING', 16))
+PASSWORD_HASH_QUEUE_TIMEOUT = 2
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/4.2/topics/i18n/
 
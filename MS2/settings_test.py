@@ -0,0 +1,21 @@
+# Настройки для тестов: python manage.py test blogs --settings=MS2.settings_test
+# Две SQLite базы, контент блогов распределяется между ними как между шардами
+from .settings import *  # noqa: F401,F403
+
+DATABASES = {
+    'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': BASE_DIR / 'test_default.sqlite3'},
+    'shard1': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': BASE_DIR / 'test_shard1.sqlite3'},
+}
+BLOG_SHARDS = ['default', 'shard1']
+
+CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'test-default'},
+    'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'test-shared'},
+}
+
+PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+METRICS_DIR = None
+PROFILING_ENABLED = False
+JOBS_EAGER = False
+# Ограничения частоты проверяются отдельными тестами, остальным они бы мешали
+REST_FRAMEWORK = dict(REST_FRAMEWORK, DEFAULT_THROTTLE_CLASSES=())
@@ -18,6 +18,7 @@ from django.contrib import admin
 from django.urls import path, include
 from django.contrib.auth.views import LoginView
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+from blogs.metrics import metrics_view
 
 
 urlpatterns = [
@@ -27,4 +28,5 @@ urlpatterns = [
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token-refresh'),  # Обновление токена
     path('api-auth/', include('rest_framework.urls')),  # Маршруты для авторизации
     path('api/', include('blogs.urls')),
+    path('metrics', metrics_view, name='metrics'),  # Метрики для Prometheus
 ]
@@ -1,9 +1,168 @@
+from django.conf import settings
 from django.contrib import admin
-from blogs.models import Blog,Post,Like,Comment,Subscription, User
-# Register your models here.
-admin.site.register(Blog)
-admin.site.register(Post)
-admin.site.register(Like)
-admin.site.register(Comment)
-admin.site.register(Subscription)
-#admin.site.register(User)
\ No newline at end of file
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models.functions import Coalesce, Now
+from django.http import QueryDict
+from django.utils.functional import cached_property
+
+from blogs.models import Blog, Post, Like, Comment, Subscription
+from blogs.objectcache import post_cache
+from blogs.sharding import GLOBAL_DB, is_sharded, shard_aliases, shard_for_post, with_users
+
+
+class EstimatedCountPaginator(Paginator):
+    """Counts exactly up to ADMIN_EXACT_COUNT_LIMIT rows; past that an unfiltered Postgres table uses the planner estimate."""
+
+    @cached_property
+    def count(self):
+        limit = getattr(settings, 'ADMIN_EXACT_COUNT_LIMIT', 10000)
+        queryset = self.object_list
+        bounded = queryset.order_by()[:limit].count()
+        if bounded < limit:
+            return bounded
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql' or queryset.query.where:
+            return super().count
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT reltuples FROM pg_class WHERE relname = %s", [queryset.model._meta.db_table])
+            row = cursor.fetchone()
+        return max(int(row[0]), limit) if row else limit
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
+
+
+class ShardListFilter(admin.SimpleListFilter):
+    title = 'shard'
+    parameter_name = 'shard'
+
+    def lookups(self, request, model_admin):
+        return [(alias, alias) for alias in shard_aliases()] if is_sharded() else []
+
+    def queryset(self, request, queryset):
+        return queryset  # База выбирается в ShardedContentAdmin.get_queryset
+
+    def choices(self, changelist):
+        # Без пункта "All": строки разных шардов в одном списке не показываются
+        for alias, title in self.lookup_choices:
+            yield {
+                'selected': (self.value() or GLOBAL_DB) == alias,
+                'query_string': changelist.get_query_string({self.parameter_name: alias}),
+                'display': title,
+            }
+
+
+class ShardedContentAdmin(LargeTableAdmin):
+    """Admin for content that lives on blog shards: one shard at a time, chosen with ShardListFilter."""
+
+    def get_shard(self, request):
+        shard = request.GET.get('shard') or QueryDict(request.GET.get('_changelist_filters', '')).get('shard')
+        return shard if shard in shard_aliases() else GLOBAL_DB
+
+    def is_changelist(self, request):
+        return bool(request.resolver_match and request.resolver_match.url_name.endswith('_changelist'))
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request).using(self.get_shard(request))
+        if self.is_changelist(request):
+            # Пользователи и блоги в другой базе: для страницы списка они грузятся одним запросом
+            # к GLOBAL_DB на поле, а JOIN на шарде вернул бы пустой список
+            queryset = with_users(queryset, *self.list_select_related)
+        return queryset
+
+    def get_list_select_related(self, request):
+        return ()  # Связи уже загружает get_queryset
+
+    def get_search_fields(self, request):
+        fields = super().get_search_fields(request)
+        return [field for field in fields if '__username' not in field] if is_sharded() else fields
+
+
+@admin.register(Blog)
+class BlogAdmin(LargeTableAdmin):
+    list_display = ('id', 'title', 'owner', 'created_at', 'updated_at')
+    list_select_related = ('owner',)
+    raw_id_fields = ('owner', 'authors')
+    search_fields = ('=id', '^title', '=owner__username')
+    list_filter = ('created_at',)
+    readonly_fields = ('shard',)
+
+
+@admin.register(Post)
+class PostAdmin(ShardedContentAdmin):
+    list_display = ('id', 'title', 'blog', 'author', 'is_published', 'views', 'created_at')
+    list_select_related = ('blog', 'author')
+    raw_id_fields = ('blog', 'author')
+    search_fields = ('=id', '^title', '=author__username')
+    list_filter = (ShardListFilter, 'is_published')
+    actions = ('publish', 'unpublish')
+
+    def get_shard(self, request):
+        object_id = request.resolver_match.kwargs.get('object_id') if request.resolver_match else None
+        if object_id and object_id.isdigit():
+            return shard_for_post(object_id) or GLOBAL_DB
+        return super().get_shard(request)
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        if self.is_changelist(request):
+            queryset = queryset.defer('body')  # В списке текст поста не показывается
+        return queryset
+
+    @admin.action(description='Publish selected posts')
+    def publish(self, request, queryset):
+        queryset = queryset.filter(is_published=False)
+        ids = list(queryset.values_list('id', flat=True))
+        updated = queryset.update(is_published=True, created_at=Coalesce('created_at', Now()))
+        self._invalidate(ids)
+        self.message_user(request, f'{updated} posts published')
+
+    @admin.action(description='Unpublish selected posts')
+    def unpublish(self, request, queryset):
+        queryset = queryset.filter(is_published=True)
+        ids = list(queryset.values_list('id', flat=True))
+        updated = queryset.update(is_published=False, created_at=None)
+        self._invalidate(ids)
+        self.message_user(request, f'{updated} posts unpublished')
+
+    def _invalidate(self, ids):
+        # update() не шлёт post_save, кэш постов сбрасываем сами
+        for post_id in ids:
+            post_cache.invalidate(post_id)
+
+
+@admin.register(Like)
+class LikeAdmin(ShardedContentAdmin):
+    list_display = ('id', 'user', 'post_id', 'created_at')
+    list_select_related = ('user',)
+    raw_id_fields = ('user', 'post')
+    search_fields = ('=user__username', '=post__id')
+    list_filter = (ShardListFilter, 'created_at')
+
+
+@admin.register(Comment)
+class CommentAdmin(ShardedContentAdmin):
+    list_display = ('id', 'author', 'post_id', 'created_at')
+    list_select_related = ('author',)
+    raw_id_fields = ('author', 'post')
+    search_fields = ('=author__username', '=post__id')
+    list_filter = (ShardListFilter, 'created_at')
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        if self.is_changelist(request):
+            queryset = queryset.defer('body')
+        return queryset
+
+
+@admin.register(Subscription)
+class SubscriptionAdmin(LargeTableAdmin):
+    list_display = ('id', 'user', 'blog', 'created_at')
+    list_select_related = ('user', 'blog')
+    raw_id_fields = ('user', 'blog')
+    search_fields = ('=user__username', '=blog__id')
+    list_filter = ('created_at',)
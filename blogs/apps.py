@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class BlogsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'blogs'
+
+    def ready(self):
+        from . import jobs, notifications, objectcache, permissions, subscriptions  # noqa: F401 обработчики фоновых задач и сигналов
+        from django.conf import settings
+        if getattr(settings, 'METRICS_ENABLED', True):
+            from . import metrics
+            metrics.install()
@@ -0,0 +1,88 @@
+import datetime
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Like, Comment, Post, ArchivedLike, ArchivedComment
+from .objectcache import post_cache
+from .sharding import shard_aliases
+
+
+def _archive_filter(days, post_days):
+    """Rows older than ``days``, or any row of a post published more than ``post_days`` ago."""
+    condition = Q(created_at__lt=timezone.now() - datetime.timedelta(days=days))
+    if post_days is not None:
+        condition |= Q(post__created_at__lt=timezone.now() - datetime.timedelta(days=post_days))
+    return condition
+
+
+def _move(model, condition, to_archive, counter_field, batch_size):
+    return sum(_move_shard(alias, model, condition, to_archive, counter_field, batch_size) for alias in shard_aliases())
+
+
+def _move_shard(alias, model, condition, to_archive, counter_field, batch_size):
+    # Архив лежит на том же шарде, что и исходные строки, так что перенос остаётся одной транзакцией
+    moved = 0
+    while True:
+        with transaction.atomic(using=alias):
+            rows = list(
+                model.objects.using(alias).filter(condition).order_by('id').select_for_update(of=('self',))[:batch_size]
+            )
+            if not rows:
+                return moved
+            to_archive(rows, alias)
+            # Счётчики на посте сохраняют likes_count и relev корректными после переноса
+            for post_id, count in Counter(row.post_id for row in rows).items():
+                Post.objects.using(alias).filter(id=post_id).update(**{counter_field: F(counter_field) + count})
+            model.objects.using(alias).filter(id__in=[row.id for row in rows]).delete()
+        # update() не шлёт post_save: без сброса кэш отдавал бы старые archived_*_count
+        for post_id in {row.post_id for row in rows}:
+            post_cache.invalidate(post_id)
+        moved += len(rows)
+
+
+def archive_likes(days, post_days=None, batch_size=1000):
+    return _move(
+        Like, _archive_filter(days, post_days),
+        lambda rows, alias: ArchivedLike.objects.using(alias).bulk_create(
+            [ArchivedLike(id=row.id, user_id=row.user_id, post_id=row.post_id, created_at=row.created_at)
+             for row in rows], ignore_conflicts=True),
+        'archived_likes_count', batch_size,
+    )
+
+
+def archive_comments(days, post_days=None, batch_size=1000):
+    return _move(
+        Comment, _archive_filter(days, post_days),
+        lambda rows, alias: ArchivedComment.objects.using(alias).bulk_create(
+            [ArchivedComment(id=row.id, post_id=row.post_id, author_id=row.author_id, body=row.body,
+                             created_at=row.created_at)
+             for row in rows], ignore_conflicts=True),
+        'archived_comments_count', batch_size,
+    )
+
+
+def archive_all(days=None, post_days=None, batch_size=None):
+    days = days if days is not None else getattr(settings, 'ARCHIVE_AFTER_DAYS', 365)
+    post_days = post_days if post_days is not None else getattr(settings, 'ARCHIVE_INACTIVE_POST_DAYS', None)
+    batch_size = batch_size or getattr(settings, 'ARCHIVE_BATCH_SIZE', 1000)
+    return {
+        'likes': archive_likes(days, post_days, batch_size),
+        'comments': archive_comments(days, post_days, batch_size),
+    }
+
+
+def unlike_archived(user, post):
+    """Remove an archived like of ``user``; returns True if there was one."""
+    db = post._state.db
+    with transaction.atomic(using=db):
+        deleted, _ = ArchivedLike.objects.using(db).filter(user_id=user.id, post_id=post.id).delete()
+        if deleted:
+            Post.objects.using(db).filter(id=post.id, archived_likes_count__gt=0) \
+                .update(archived_likes_count=F('archived_likes_count') - 1)
+    if deleted:
+        post_cache.invalidate(post.id)
+    return bool(deleted)
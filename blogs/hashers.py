@@ -0,0 +1,87 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, Argon2PasswordHasher, ScryptPasswordHasher
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+
+class PasswordHashingBusy(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Too many logins in progress, try again later.'
+    default_code = 'password_hashing_busy'
+
+
+_executor = None
+_slots = None
+_init_lock = threading.Lock()
+
+
+def _workers():
+    return getattr(settings, 'PASSWORD_HASH_WORKERS', None) or os.cpu_count() or 1
+
+
+def max_pending():
+    """How many hashing calls may wait for the pool before new ones fail with PasswordHashingBusy."""
+    return getattr(settings, 'PASSWORD_HASH_MAX_PENDING', None) or _workers() * 4
+
+
+def _pool():
+    global _executor, _slots
+    if _executor is None:
+        with _init_lock:
+            if _executor is None:
+                _slots = threading.BoundedSemaphore(max_pending())
+                _executor = ThreadPoolExecutor(max_workers=_workers(), thread_name_prefix='password-hash')
+    return _executor, _slots
+
+
+def run_bounded(func, *args):
+    """Run a hashing call on the shared pool; when the pool's queue is full, fail fast with 503."""
+    if threading.current_thread().name.startswith('password-hash'):
+        return func(*args)
+    executor, slots = _pool()
+    if not slots.acquire(timeout=getattr(settings, 'PASSWORD_HASH_QUEUE_TIMEOUT', 2)):
+        raise PasswordHashingBusy()
+    try:
+        return executor.submit(func, *args).result()
+    finally:
+        slots.release()
+
+
+class ConfigurablePBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """pbkdf2_sha256 with PASSWORD_HASH_ITERATIONS; hashes with another count are rehashed on login."""
+
+    @property
+    def iterations(self):
+        return getattr(settings, 'PASSWORD_HASH_ITERATIONS', PBKDF2PasswordHasher.iterations)
+
+    def encode(self, password, salt, iterations=None):
+        return run_bounded(super().encode, password, salt, iterations)
+
+
+class ConfigurableArgon2PasswordHasher(Argon2PasswordHasher):
+    @property
+    def time_cost(self):
+        return getattr(settings, 'PASSWORD_HASH_ARGON2_TIME_COST', Argon2PasswordHasher.time_cost)
+
+    @property
+    def memory_cost(self):
+        return getattr(settings, 'PASSWORD_HASH_ARGON2_MEMORY_COST', Argon2PasswordHasher.memory_cost)
+
+    def encode(self, password, salt):
+        return run_bounded(super().encode, password, salt)
+
+    def verify(self, password, encoded):
+        return run_bounded(super().verify, password, encoded)
+
+
+class ConfigurableScryptPasswordHasher(ScryptPasswordHasher):
+    @property
+    def work_factor(self):
+        return getattr(settings, 'PASSWORD_HASH_SCRYPT_WORK_FACTOR', ScryptPasswordHasher.work_factor)
+
+    def encode(self, password, salt, n=None, r=None, p=None):
+        return run_bounded(super().encode, password, salt, n, r, p)
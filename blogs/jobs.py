@@ -0,0 +1,177 @@
+import datetime
+import logging
+import traceback
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.signals import pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Blog, Post, Comment, Like, Subscription, Job, Notification, ArchivedLike, ArchivedComment
+from .permissions import invalidate_blog_members
+from .objectcache import blog_cache
+from .sharding import GLOBAL_DB, shard_aliases, shard_for_blog
+
+logger = logging.getLogger(__name__)
+
+HANDLERS = {}
+
+
+def job(name):
+    """Register a function as the handler of jobs called ``name``; it receives the job payload."""
+    def decorator(func):
+        HANDLERS[name] = func
+        return func
+    return decorator
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def enqueue(name, payload=None, key=None, delay=0, max_attempts=None):
+    """Store a job for the worker. Jobs with an already used ``key`` are not created twice."""
+    if name not in HANDLERS:
+        raise ValueError(f"Unknown job {name}")
+    fields = {
+        'name': name,
+        'payload': payload or {},
+        'run_after': timezone.now() + datetime.timedelta(seconds=delay),
+        'max_attempts': max_attempts or _setting('JOBS_MAX_ATTEMPTS', 5),
+    }
+    if key:
+        job_, created = Job.objects.get_or_create(idempotency_key=key, defaults=fields)
+    else:
+        job_, created = Job.objects.create(**fields), True
+    if created and _setting('JOBS_EAGER', False):
+        transaction.on_commit(lambda: run_job(job_))
+    return job_
+
+
+def _backoff(attempts):
+    base = _setting('JOBS_RETRY_BACKOFF', 5)
+    return datetime.timedelta(seconds=min(base * 2 ** (attempts - 1), _setting('JOBS_RETRY_BACKOFF_MAX', 3600)))
+
+
+def claim_jobs(limit):
+    """Lock up to ``limit`` due jobs for this worker with conditional UPDATEs, so workers never share a job."""
+    current = timezone.now()
+    stale = current - datetime.timedelta(seconds=_setting('JOBS_LOCK_TIMEOUT', 600))
+    due = Job.objects.filter(
+        Q(status=Job.PENDING, run_after__lte=current) | Q(status=Job.RUNNING, locked_at__lt=stale)
+    ).order_by('run_after').values_list('id', 'status')[:limit]
+    claimed = []
+    for job_id, job_status in due:
+        if Job.objects.filter(id=job_id, status=job_status).update(status=Job.RUNNING, locked_at=current):
+            claimed.append(Job.objects.get(id=job_id))
+    return claimed
+
+
+def run_job(job_):
+    handler = HANDLERS.get(job_.name)
+    job_.attempts += 1
+    try:
+        if handler is None:
+            raise LookupError(f"No handler for job {job_.name}")
+        handler(job_.payload)
+    except Exception:
+        job_.last_error = traceback.format_exc()
+        if job_.attempts >= job_.max_attempts:
+            job_.status = Job.FAILED
+            logger.error("Job %s failed permanently", job_.id)
+        else:
+            job_.status = Job.PENDING
+            job_.run_after = timezone.now() + _backoff(job_.attempts)
+        job_.save(update_fields=['status', 'attempts', 'last_error', 'run_after'])
+        return False
+    job_.status = Job.DONE
+    job_.save(update_fields=['status', 'attempts'])
+    return True
+
+
+def run_pending(limit=100):
+    """Run one batch of due jobs and return how many were processed."""
+    jobs = claim_jobs(limit)
+    for job_ in jobs:
+        run_job(job_)
+    return len(jobs)
+
+
+def prune_jobs(days=None):
+    """Delete finished and permanently failed jobs older than JOBS_RETENTION_DAYS; returns how many."""
+    days = days if days is not None else _setting('JOBS_RETENTION_DAYS', 7)
+    cutoff = timezone.now() - datetime.timedelta(days=days)
+    old = Job.objects.filter(status__in=[Job.DONE, Job.FAILED], run_after__lt=cutoff)
+    total = old.count()
+    delete_in_batches(old)
+    return total
+
+
+def delete_in_batches(queryset, batch_size=None):
+    batch_size = batch_size or _setting('JOBS_DELETE_BATCH_SIZE', 1000)
+    model = queryset.model
+    while True:
+        ids = list(queryset.values_list('id', flat=True)[:batch_size])
+        if not ids:
+            break
+        model.objects.using(queryset.db).filter(id__in=ids).delete()
+
+
+@job('blogs.touch_blog')
+def touch_blog(payload):
+    updated_at = parse_datetime(payload['updated_at'])
+    # Только вперёд: устаревшая задача не откатит updated_at назад
+    Blog.objects.filter(id=payload['blog_id']).filter(
+        Q(updated_at__isnull=True) | Q(updated_at__lt=updated_at)
+    ).update(updated_at=updated_at)
+    blog_cache.invalidate(payload['blog_id'])
+
+
+@job('blogs.delete_blog')
+def delete_blog(payload):
+    blog_id = payload['blog_id']
+    shard = shard_for_blog(blog_id)
+    delete_in_batches(Like.objects.using(shard).filter(post__blog_id=blog_id))
+    delete_in_batches(Comment.objects.using(shard).filter(post__blog_id=blog_id))
+    delete_in_batches(ArchivedLike.objects.using(shard).filter(post__blog_id=blog_id))
+    delete_in_batches(ArchivedComment.objects.using(shard).filter(post__blog_id=blog_id))
+    delete_in_batches(Post.objects.using(shard).filter(blog_id=blog_id))
+    delete_in_batches(Subscription.objects.filter(blog_id=blog_id))
+    delete_in_batches(Notification.objects.filter(blog_id=blog_id))
+    Blog.objects.filter(id=blog_id).delete()
+    invalidate_blog_members(blog_id)
+
+
+@receiver(pre_delete, sender=User, dispatch_uid='jobs_user_content_delete')
+def delete_user_content(sender, instance, **kwargs):
+    # CASCADE от пользователя удаляет только строки в GLOBAL_DB; контент на остальных шардах
+    # (его посты, лайки и комментарии и всё из его блогов) удаляем сами, иначе списки ссылаются на удалённого автора
+    blog_ids = list(Blog.objects.filter(owner=instance).values_list('id', flat=True))
+    of_posts = Q(post__author=instance) | Q(post__blog_id__in=blog_ids)
+    for alias in shard_aliases():
+        if alias == GLOBAL_DB:
+            continue
+        delete_in_batches(Like.objects.using(alias).filter(of_posts | Q(user=instance)))
+        delete_in_batches(Comment.objects.using(alias).filter(of_posts | Q(author=instance)))
+        delete_in_batches(ArchivedLike.objects.using(alias).filter(of_posts | Q(user=instance)))
+        delete_in_batches(ArchivedComment.objects.using(alias).filter(of_posts | Q(author=instance)))
+        delete_in_batches(Post.objects.using(alias).filter(Q(author=instance) | Q(blog_id__in=blog_ids)))
+
+
+def schedule_blog_delete(blog_id):
+    """Hide the blog and close it for writes at once, then leave the batched delete to the worker."""
+    with transaction.atomic():
+        Blog.objects.filter(id=blog_id).update(is_deleting=True)
+        enqueue('blogs.delete_blog', {'blog_id': blog_id}, key=f'delete_blog:{blog_id}')
+    # update() не шлёт post_save
+    blog_cache.invalidate(blog_id)
+    invalidate_blog_members(blog_id)
+
+
+def schedule_blog_touch(blog_id, updated_at, post_id):
+    enqueue('blogs.touch_blog', {'blog_id': blog_id, 'updated_at': updated_at.isoformat()},
+            key=f'touch_blog:{blog_id}:{post_id}:{updated_at.isoformat()}')
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from blogs.archive import archive_all
+
+
+class Command(BaseCommand):
+    help = 'Moves old likes and comments into archive tables in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None, help='Archive rows older than this (ARCHIVE_AFTER_DAYS)')
+        parser.add_argument('--post-days', type=int, default=None,
+                            help='Also archive all rows of posts published more than this many days ago')
+        parser.add_argument('--batch-size', type=int, default=None)
+
+    def handle(self, *args, **options):
+        moved = archive_all(options['days'], options['post_days'], options['batch_size'])
+        self.stdout.write(f"Archived {moved['likes']} likes and {moved['comments']} comments")
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from blogs.models import Post
+from blogs.sharding import shard_aliases
+
+
+class Command(BaseCommand):
+    help = 'Fills Post.excerpt, body_length and reading_time for existing posts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--all', action='store_true', help='Recompute every post, not only missing excerpts')
+
+    def handle(self, *args, **options):
+        updated = sum(self.backfill(alias, options) for alias in shard_aliases())
+        self.stdout.write(f'Updated {updated} posts')
+
+    def backfill(self, alias, options):
+        posts = Post.objects.using(alias).only('id', 'body').order_by('id')
+        if not options['all']:
+            posts = posts.filter(excerpt='').exclude(body='')
+        last_id, updated = 0, 0
+        while True:
+            batch = list(posts.filter(id__gt=last_id)[:options['batch_size']])
+            if not batch:
+                return updated
+            for post in batch:
+                post.fill_excerpt()
+            Post.objects.using(alias).bulk_update(batch, ['excerpt', 'body_length', 'reading_time'])
+            last_id = batch[-1].id
+            updated += len(batch)
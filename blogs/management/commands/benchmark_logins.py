@@ -0,0 +1,37 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, make_password
+from django.core.management.base import BaseCommand, CommandError
+
+from blogs.hashers import max_pending
+
+
+class Command(BaseCommand):
+    help = 'Measures password checks (logins) per second for the current PASSWORD_HASH_PROFILE'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--logins', type=int, default=50)
+        parser.add_argument('--threads', type=int, default=os.cpu_count() or 1)
+
+    def handle(self, *args, **options):
+        # Больше одновременных проверок пул не принимает: лишние получили бы PasswordHashingBusy вместо замера
+        threads = min(options['threads'], max_pending())
+        if threads < options['threads']:
+            self.stderr.write(f"--threads capped to PASSWORD_HASH_MAX_PENDING={threads}")
+        encoded = make_password('benchmark-password')
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            results = list(pool.map(lambda _: check_password('benchmark-password', encoded), range(options['logins'])))
+        elapsed = time.perf_counter() - started
+        if not all(results):
+            raise CommandError('Password check failed')
+        cores = os.cpu_count() or 1
+        rate = options['logins'] / elapsed
+        self.stdout.write(
+            f"profile={settings.PASSWORD_HASH_PROFILE} hasher={encoded.split('$', 1)[0]} "
+            f"logins={options['logins']} threads={threads} elapsed={elapsed:.2f}s "
+            f"logins/s={rate:.1f} logins/s/core={rate / cores:.1f}"
+        )
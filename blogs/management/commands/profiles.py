@@ -0,0 +1,98 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from blogs.profiling import get_store, make_profile_token, summarize
+
+
+class Command(BaseCommand):
+    help = 'Lists, summarizes and diffs request profiles captured by ProfilingMiddleware'
+
+    def add_arguments(self, parser):
+        actions = parser.add_subparsers(dest='action', required=True)
+        listing = actions.add_parser('list', help='Captured profiles, newest first')
+        listing.add_argument('--view', help='Only profiles of this URL name')
+        listing.add_argument('--limit', type=int, default=50)
+        summary = actions.add_parser('summary', help='Hot functions and SQL of one profile or of all profiles of a view')
+        summary.add_argument('target', help='Profile id or URL name')
+        summary.add_argument('--top', type=int, default=15)
+        diff = actions.add_parser('diff', help='Compare two profiles or two views (e.g. before and after a deploy)')
+        diff.add_argument('base', help='Profile id or URL name')
+        diff.add_argument('other', help='Profile id or URL name')
+        diff.add_argument('--top', type=int, default=15)
+        actions.add_parser('sign', help='Print a value for the profiling request header')
+
+    def handle(self, *args, **options):
+        getattr(self, f"handle_{options['action']}")(options)
+
+    def _profiles(self, target, store):
+        profile = store.get(target)
+        if profile is not None:
+            return [profile]
+        profiles = [profile for profile in store.all() if profile['view'] == target]
+        if not profiles:
+            raise CommandError(f'No profiles for "{target}"')
+        return profiles
+
+    def handle_list(self, options):
+        profiles = get_store().all()
+        if options['view']:
+            profiles = [profile for profile in profiles if profile['view'] == options['view']]
+        for profile in reversed(profiles[-options['limit']:]):
+            created = datetime.datetime.fromtimestamp(profile['created']).strftime('%Y-%m-%d %H:%M:%S')
+            self.stdout.write(
+                f"{profile['id']}  {created}  {profile['duration'] * 1000:8.1f} ms  {profile['reason']:<7}  "
+                f"{profile['status']}  {profile['method']} {profile['view']}  "
+                f"sql: {profile['sql_count']} / {profile['sql_time'] * 1000:.1f} ms"
+            )
+
+    def handle_summary(self, options):
+        summary = summarize(self._profiles(options['target'], get_store()))
+        self.stdout.write(
+            f"{summary['profiles']} profile(s), {summary['samples']} samples; "
+            f"duration mean {summary['duration_mean'] * 1000:.1f} ms, p50 {summary['duration_p50'] * 1000:.1f} ms, "
+            f"max {summary['duration_max'] * 1000:.1f} ms; "
+            f"SQL per request {summary['sql_count_mean']:.1f} queries / {summary['sql_time_mean'] * 1000:.1f} ms"
+        )
+        self._table('Self time', summary['self'], options['top'])
+        self._table('Cumulative time', summary['cumulative'], options['top'])
+        self.stdout.write('\nSQL (per request: count, total ms)')
+        statements = sorted(summary['sql'].items(), key=lambda item: item[1][1], reverse=True)
+        for statement, (count, elapsed) in statements[:options['top']]:
+            self.stdout.write(f'  {count:6.1f} {elapsed * 1000:9.2f}  {statement[:160]}')
+
+    def _table(self, title, shares, top):
+        self.stdout.write(f'\n{title}')
+        for name, share in sorted(shares.items(), key=lambda item: item[1], reverse=True)[:top]:
+            self.stdout.write(f'  {share * 100:6.1f}%  {name}')
+
+    def handle_diff(self, options):
+        store = get_store()
+        base = summarize(self._profiles(options['base'], store))
+        other = summarize(self._profiles(options['other'], store))
+        self.stdout.write(
+            f"duration mean {base['duration_mean'] * 1000:.1f} -> {other['duration_mean'] * 1000:.1f} ms; "
+            f"SQL per request {base['sql_count_mean']:.1f} -> {other['sql_count_mean']:.1f} queries, "
+            f"{base['sql_time_mean'] * 1000:.1f} -> {other['sql_time_mean'] * 1000:.1f} ms"
+        )
+        for title, key in (('Self time', 'self'), ('Cumulative time', 'cumulative')):
+            self.stdout.write(f'\n{title} (share of samples, changed most first)')
+            names = set(base[key]) | set(other[key])
+            deltas = sorted(names, key=lambda name: abs(other[key].get(name, 0) - base[key].get(name, 0)), reverse=True)
+            for name in deltas[:options['top']]:
+                before, after = base[key].get(name, 0), other[key].get(name, 0)
+                self.stdout.write(f'  {before * 100:6.1f}% -> {after * 100:6.1f}% ({(after - before) * 100:+.1f})  {name}')
+        self.stdout.write('\nSQL (per request ms, changed most first)')
+        statements = set(base['sql']) | set(other['sql'])
+        changes = sorted(
+            statements,
+            key=lambda s: abs(other['sql'].get(s, (0, 0))[1] - base['sql'].get(s, (0, 0))[1]), reverse=True,
+        )
+        for statement in changes[:options['top']]:
+            before, after = base['sql'].get(statement, (0, 0)), other['sql'].get(statement, (0, 0))
+            self.stdout.write(
+                f'  {before[0]:5.1f}x {before[1] * 1000:8.2f} -> {after[0]:5.1f}x {after[1] * 1000:8.2f}  {statement[:140]}'
+            )
+
+    def handle_sign(self, options):
+        self.stdout.write(make_profile_token())
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from blogs.jobs import prune_jobs
+
+
+class Command(BaseCommand):
+    help = 'Deletes done and failed background jobs older than JOBS_RETENTION_DAYS'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None, help='Override the retention period')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'Deleted {prune_jobs(options["days"])} jobs')
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from blogs.notifications import prune_notifications
+
+
+class Command(BaseCommand):
+    help = 'Deletes notifications older than NOTIFICATIONS_RETENTION_DAYS'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None, help='Override the retention period')
+
+    def handle(self, *args, **options):
+        prune_notifications(options['days'])
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from blogs.stats import rollup_all
+
+
+class Command(BaseCommand):
+    help = 'Folds new likes, comments, subscriptions and post views into daily per-blog statistics'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        processed = rollup_all(options['batch_size'])
+        self.stdout.write(', '.join(f'{field}: {count}' for field, count in processed.items()))
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from blogs.jobs import run_pending
+
+
+class Command(BaseCommand):
+    help = 'Runs queued background jobs (blog updates, notifications, batched deletes)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Process due jobs once and exit')
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--sleep', type=float, default=1.0, help='Seconds to wait when the queue is empty')
+
+    def handle(self, *args, **options):
+        while True:
+            processed = run_pending(options['batch_size'])
+            if processed:
+                self.stdout.write(f'Processed {processed} jobs')
+            if options['once']:
+                if not processed:
+                    break
+                continue
+            if not processed:
+                time.sleep(options['sleep'])
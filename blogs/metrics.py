@@ -0,0 +1,328 @@
+import contextlib
+import glob
+import json
+import os
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+from rest_framework.renderers import JSONRenderer, BrowsableAPIRenderer
+from rest_framework.serializers import BaseSerializer
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+PHASES = ('db', 'serialize', 'render', 'other')
+
+
+def _buckets():
+    return tuple(getattr(settings, 'METRICS_BUCKETS', DEFAULT_BUCKETS))
+
+
+class _Shard:
+    """Metrics written by one thread; only the owner mutates it, so the hot path takes no locks."""
+
+    def __init__(self, thread=None):
+        self.thread = thread
+        self.counters = {}
+        self.histograms = {}
+
+    def inc(self, key, value=1):
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, key, value, buckets):
+        hist = self.histograms.get(key)
+        if hist is None:
+            hist = self.histograms[key] = [[0] * len(buckets), 0.0, 0]
+        for i, bound in enumerate(buckets):
+            if value <= bound:
+                hist[0][i] += 1
+                break
+        hist[1] += value
+        hist[2] += 1
+
+    def merge(self, counters, histograms):
+        for key, value in counters.items():
+            self.counters[key] = self.counters.get(key, 0) + value
+        for key, (counts, total, count) in histograms.items():
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = self.histograms[key] = [[0] * len(counts), 0.0, 0]
+            hist[0] = [a + b for a, b in zip(hist[0], counts)]
+            hist[1] += total
+            hist[2] += count
+
+
+class Registry:
+    """Per-thread shards summed on scrape; shards of finished threads are folded into one retired shard."""
+
+    def __init__(self):
+        self._local = threading.local()
+        self._shards = []
+        self._retired = _Shard()
+        self._lock = threading.Lock()
+
+    def shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = _Shard(threading.current_thread())
+            with self._lock:
+                self._shards.append(shard)
+        return shard
+
+    def snapshot(self):
+        """``(counters, histograms)`` of this process; histogram values are non-cumulative bucket counts."""
+        total = _Shard()
+        with self._lock:
+            alive = []
+            for shard in self._shards:
+                # dict.copy() выполняется целиком под GIL, поэтому запись владельца не мешает чтению
+                counters, histograms = shard.counters.copy(), shard.histograms.copy()
+                if shard.thread.is_alive():
+                    alive.append(shard)
+                    total.merge(counters, _copy_histograms(histograms))
+                else:
+                    self._retired.merge(counters, _copy_histograms(histograms))
+            self._shards = alive
+            total.merge(self._retired.counters, self._retired.histograms)
+        return total.counters, total.histograms
+
+    def clear(self):
+        with self._lock:
+            for shard in self._shards:
+                shard.counters.clear()
+                shard.histograms.clear()
+            self._retired = _Shard()
+
+
+def _copy_histograms(histograms):
+    return {key: (list(counts), total, count) for key, (counts, total, count) in histograms.items()}
+
+
+registry = Registry()
+
+
+# --- Разбивка времени запроса по фазам ---
+
+_request = threading.local()
+
+
+@contextlib.contextmanager
+def phase(name):
+    """Time a phase of the current request; time spent in nested phases is not counted twice."""
+    stack = getattr(_request, 'stack', None)
+    if stack is None:
+        yield
+        return
+    frame = [time.perf_counter(), 0.0]
+    stack.append(frame)
+    try:
+        yield
+    finally:
+        stack.pop()
+        elapsed = time.perf_counter() - frame[0]
+        _request.phases[name] = _request.phases.get(name, 0.0) + elapsed - frame[1]
+        if stack:
+            stack[-1][1] += elapsed
+
+
+def _db_wrapper(execute, sql, params, many, context):
+    _request.queries += 1
+    with phase('db'):
+        return execute(sql, params, many, context)
+
+
+_original_serializer_data = BaseSerializer.data
+
+
+def _timed_serializer_data(self):
+    with phase('serialize'):
+        return _original_serializer_data.fget(self)
+
+
+def install():
+    """Hook serializer output into the 'serialize' phase; called from AppConfig.ready when metrics are enabled."""
+    BaseSerializer.data = property(_timed_serializer_data)
+
+
+class TimedRendererMixin:
+    def render(self, *args, **kwargs):
+        with phase('render'):
+            return super().render(*args, **kwargs)
+
+
+class TimedJSONRenderer(TimedRendererMixin, JSONRenderer):
+    pass
+
+
+class TimedBrowsableAPIRenderer(TimedRendererMixin, BrowsableAPIRenderer):
+    pass
+
+
+def _view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match is not None else '<unmatched>'
+
+
+class MetricsMiddleware:
+    """Records count, status and latency histograms (total and per phase) of every request by URL name."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not getattr(settings, 'METRICS_ENABLED', True) or request.path == '/metrics':
+            return self.get_response(request)
+        _request.stack, _request.phases, _request.queries = [], {}, 0
+        start = time.perf_counter()
+        try:
+            with contextlib.ExitStack() as wrappers:
+                for connection in connections.all():
+                    wrappers.enter_context(connection.execute_wrapper(_db_wrapper))
+                response = self.get_response(request)
+        finally:
+            elapsed = time.perf_counter() - start
+            phases, queries = _request.phases, _request.queries
+            del _request.stack, _request.phases, _request.queries
+        self.record(_view_name(request), request.method, response.status_code, elapsed, phases, queries)
+        return response
+
+    def record(self, view, method, status_code, elapsed, phases, queries):
+        buckets = _buckets()
+        shard = registry.shard()
+        shard.inc(('http_requests_total', (('view', view), ('method', method), ('status', str(status_code)))))
+        shard.inc(('http_db_queries_total', (('view', view),)), queries)
+        shard.observe(('http_request_duration_seconds', (('view', view),)), elapsed, buckets)
+        phases['other'] = max(elapsed - sum(phases.values()), 0.0)
+        for name in PHASES:
+            shard.observe(('http_request_phase_seconds', (('view', view), ('phase', name))), phases.get(name, 0.0),
+                          buckets)
+        store = get_store()
+        if store is not None:
+            store.maybe_flush()
+
+
+# --- Общий вид по всем процессам-воркерам ---
+
+class FileSnapshotStore:
+    """Each worker periodically writes its totals to METRICS_DIR; a scrape sums the files of all workers.
+
+    The directory should be emptied when the whole service restarts, as with prometheus_client multiprocess mode.
+    """
+
+    def __init__(self):
+        self.directory = settings.METRICS_DIR
+        os.makedirs(self.directory, exist_ok=True)
+        self.path = os.path.join(self.directory, f'metrics-{os.getpid()}-{uuid.uuid4().hex[:8]}.json')
+        self.interval = getattr(settings, 'METRICS_FLUSH_INTERVAL', 5)
+        self._next_flush = 0.0
+        self._lock = threading.Lock()
+
+    def maybe_flush(self):
+        if time.monotonic() >= self._next_flush and self._lock.acquire(blocking=False):
+            try:
+                self.flush()
+            finally:
+                self._lock.release()
+
+    def flush(self):
+        self._next_flush = time.monotonic() + self.interval
+        counters, histograms = registry.snapshot()
+        data = {
+            'counters': [[name, labels, value] for (name, labels), value in counters.items()],
+            'histograms': [[name, labels, hist] for (name, labels), hist in histograms.items()],
+        }
+        tmp = f'{self.path}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp, self.path)
+
+    def collect(self):
+        self.flush()
+        total = _Shard()
+        for path in glob.glob(os.path.join(self.directory, 'metrics-*.json')):
+            try:
+                with open(path) as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            total.merge(
+                {(name, _labels(labels)): value for name, labels, value in data['counters']},
+                {(name, _labels(labels)): hist for name, labels, hist in data['histograms']},
+            )
+        return total.counters, total.histograms
+
+
+def _labels(labels):
+    return tuple(tuple(pair) for pair in labels)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """The snapshot file of this process, or None when METRICS_DIR is not set."""
+    global _store
+    if _store is None and getattr(settings, 'METRICS_DIR', None):
+        with _store_lock:
+            if _store is None:
+                _store = FileSnapshotStore()
+    return _store
+
+
+def collect():
+    store = get_store()
+    return store.collect() if store is not None else registry.snapshot()
+
+
+# --- Формат Prometheus ---
+
+HELP = {
+    'http_requests_total': ('counter', 'Requests by view, method and status code.'),
+    'http_db_queries_total': ('counter', 'SQL queries executed by requests to the view.'),
+    'http_request_duration_seconds': ('histogram', 'Total request latency.'),
+    'http_request_phase_seconds': ('histogram', 'Request latency spent in db, serialize, render and other code.'),
+}
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (f'{key}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+               for key, value in pairs)
+    return '{' + ','.join(escaped) + '}'
+
+
+def render_prometheus(counters, histograms):
+    buckets = _buckets()
+    lines = []
+    for name, (kind, help_text) in HELP.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        if kind == 'counter':
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f'{name}{_format_labels(labels)} {value}')
+            continue
+        for (metric, labels), (counts, total, count) in sorted(histograms.items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, bucket_count in zip(buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{name}_bucket{_format_labels(labels, [("le", bound)])} {cumulative}')
+            lines.append(f'{name}_bucket{_format_labels(labels, [("le", "+Inf")])} {count}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {total}')
+            lines.append(f'{name}_count{_format_labels(labels)} {count}')
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if token and not constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return HttpResponseForbidden()
+    return HttpResponse(render_prometheus(*collect()), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.2 on 2026-10-19 14:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blogs', '0004_blog_stats'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='blog',
+            index=models.Index(fields=['created_at', 'id'], name='blogs_blog_created_5b2cf2_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['is_published', 'created_at', 'id'], name='blogs_post_is_publ_415fd9_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.2 on 2026-10-19 14:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blogs', '0007_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='body_length',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='excerpt',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='reading_time',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
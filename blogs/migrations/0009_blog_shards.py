@@ -0,0 +1,80 @@
+# Generated by Django 4.2.2 on 2026-10-19 14:55
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.core.management.color import no_style
+
+
+def create_post_locators(apps, schema_editor):
+    Post = apps.get_model('blogs', 'Post')
+    PostLocator = apps.get_model('blogs', 'PostLocator')
+    connection = schema_editor.connection
+    posts = Post.objects.using(connection.alias).values_list('id', 'blog_id').order_by('id')
+    last_id = 0
+    while True:
+        batch = list(posts.filter(id__gt=last_id)[:1000])
+        if not batch:
+            break
+        PostLocator.objects.using(connection.alias).bulk_create(
+            [PostLocator(id=post_id, blog_id=blog_id) for post_id, blog_id in batch]
+        )
+        last_id = batch[-1][0]
+    # Следующие id должны продолжать уже существующие
+    with connection.cursor() as cursor:
+        for sql in connection.ops.sequence_reset_sql(no_style(), [PostLocator]):
+            cursor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('blogs', '0008_post_excerpt'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='archivedcomment',
+            name='author',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='archivedlike',
+            name='user',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='comment',
+            name='author',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='like',
+            name='user',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='notification',
+            name='post',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, to='blogs.post'),
+        ),
+        migrations.AlterField(
+            model_name='post',
+            name='author',
+            field=models.ForeignKey(db_constraint=False, default=1, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='post',
+            name='blog',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='posts', to='blogs.blog'),
+        ),
+        migrations.CreateModel(
+            name='PostLocator',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('blog', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='blogs.blog')),
+            ],
+        ),
+        migrations.RunPython(create_post_locators, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.2 on 2026-10-19 15:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blogs', '0009_blog_shards'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blog',
+            name='version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
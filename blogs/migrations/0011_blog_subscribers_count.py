@@ -0,0 +1,48 @@
+# Generated by Django 4.2.2 on 2026-10-19 15:12
+
+from django.db import migrations, models
+from django.db.models import Count, Min, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def remove_duplicate_subscriptions(apps, schema_editor):
+    Subscription = apps.get_model('blogs', 'Subscription')
+    subscriptions = Subscription.objects.using(schema_editor.connection.alias)
+    duplicates = subscriptions.values('user_id', 'blog_id').annotate(first_id=Min('id'), total=Count('id')) \
+        .filter(total__gt=1).order_by()
+    for row in duplicates:
+        subscriptions.filter(user_id=row['user_id'], blog_id=row['blog_id'], id__gt=row['first_id']).delete()
+
+
+def count_subscribers(apps, schema_editor):
+    Blog = apps.get_model('blogs', 'Blog')
+    Subscription = apps.get_model('blogs', 'Subscription')
+    alias = schema_editor.connection.alias
+    counts = Subscription.objects.using(alias).filter(blog_id=OuterRef('pk')).order_by() \
+        .values('blog_id').annotate(total=Count('id')).values('total')
+    Blog.objects.using(alias).update(subscribers_count=Coalesce(Subquery(counts), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blogs', '0010_versioning'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blog',
+            name='subscribers_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(remove_duplicate_subscriptions, migrations.RunPython.noop),
+        migrations.RunPython(count_subscribers, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='subscription',
+            index=models.Index(fields=['blog', 'id'], name='blogs_subsc_blog_id_3e6f1b_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='subscription',
+            constraint=models.UniqueConstraint(fields=('user', 'blog'), name='unique_subscription'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.2.2 on 2026-10-19 15:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blogs', '0011_blog_subscribers_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blog',
+            name='is_deleting',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddIndex(
+            model_name='blog',
+            index=models.Index(condition=models.Q(('is_deleting', True)), fields=['is_deleting'], name='blog_deleting_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.2 on 2026-10-19 15:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blogs', '0012_blog_is_deleting'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(condition=models.Q(('is_published', True)), fields=['blog', 'id'], name='post_published_blog_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.2 on 2026-10-19 15:39
+
+import blogs.sharding
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import Mod
+
+
+def assign_existing_shards(apps, schema_editor):
+    # Существующие блоги остаются там, куда их направляла прежняя схема BLOG_SHARDS[id % len(BLOG_SHARDS)]
+    Blog = apps.get_model('blogs', 'Blog')
+    aliases = getattr(settings, 'BLOG_SHARDS', None) or ['default']
+    rows = Blog.objects.using(schema_editor.connection.alias)
+    for index, alias in enumerate(aliases):
+        rows.alias(remainder=Mod('id', len(aliases))).filter(remainder=index).update(shard=alias)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blogs', '0013_post_published_blog_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blog',
+            name='shard',
+            field=models.CharField(default=blogs.sharding.new_blog_shard, max_length=64),
+        ),
+        migrations.RunPython(assign_existing_shards, migrations.RunPython.noop),
+    ]
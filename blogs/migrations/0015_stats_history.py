@@ -0,0 +1,62 @@
+# Generated by Django 4.2.2 on 2026-10-19 15:42
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.migrations.recorder import MigrationRecorder
+from django.db.models import Max, Sum
+
+
+def seed_stats_history(apps, schema_editor):
+    # Данные старше 0004_blog_stats не должны попасть в статистику днём первой свёртки
+    connection = schema_editor.connection
+    applied = MigrationRecorder(connection).migration_qs.filter(app='blogs', name='0004_blog_stats') \
+        .values_list('applied', flat=True).first()
+    if applied is None:
+        return
+    Blog = apps.get_model('blogs', 'Blog')
+    Post = apps.get_model('blogs', 'Post')
+    Subscription = apps.get_model('blogs', 'Subscription')
+    StatsWatermark = apps.get_model('blogs', 'StatsWatermark')
+    BlogViewsWatermark = apps.get_model('blogs', 'BlogViewsWatermark')
+    db = connection.alias
+
+    # 0004 записала существующим подпискам время миграции; настоящая дата неизвестна
+    old = Subscription.objects.using(db).filter(created_at__lte=applied)
+    last_id = old.aggregate(last_id=Max('id'))['last_id']
+    if last_id is not None:
+        old.update(created_at=None)
+        mark, _ = StatsWatermark.objects.using(db).get_or_create(name='subscribers')
+        if mark.last_id < last_id:
+            mark.last_id = last_id
+            mark.save(update_fields=['last_id'])
+
+    # Просмотры блогов, ни разу не свёрнутых, накоплены за всю историю: отметка - их текущая сумма
+    blog_ids = set(
+        Blog.objects.using(db).filter(created_at__lte=applied)
+        .exclude(id__in=BlogViewsWatermark.objects.using(db).values('blog_id')).values_list('id', flat=True)
+    )
+    if not blog_ids:
+        return
+    totals = {}
+    for alias in getattr(settings, 'BLOG_SHARDS', None) or ['default']:
+        rows = Post.objects.using(alias).values('blog_id').annotate(total=Sum('views')).order_by()
+        totals.update((blog_id, total) for blog_id, total in rows.values_list('blog_id', 'total') if blog_id in blog_ids)
+    BlogViewsWatermark.objects.using(db).bulk_create(
+        [BlogViewsWatermark(blog_id=blog_id, views_total=total) for blog_id, total in totals.items()], batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blogs', '0014_blog_shard'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='subscription',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, null=True),
+        ),
+        migrations.RunPython(seed_stats_history, migrations.RunPython.noop),
+    ]
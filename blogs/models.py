@@ -1,53 +1,201 @@
-from django.db import models
+from django.db import models, router, transaction
 from django.contrib.auth.models import User
 
+from django.utils.text import Truncator
 from django.utils.timezone import now
 
+from .sharding import new_blog_shard, shard_for_blog, shard_for_post
+
+EXCERPT_LENGTH = 300
+WORDS_PER_MINUTE = 200
+
+
+class VersionConflict(Exception):
+    """The row was edited by someone else since the version the client started from."""
+
+
+class DirtyFieldsMixin:
+    """Saves of loaded instances write only the fields changed since loading.
+
+    Changes to ``VERSIONED_FIELDS`` bump ``version``; ``save_edit`` additionally makes the UPDATE
+    conditional on the version the client saw and raises VersionConflict if the row has moved on.
+    """
+    VERSIONED_FIELDS = ()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        super().refresh_from_db(using, fields, **kwargs)
+        self.mark_clean(*(self._meta.get_field(name).attname for name in fields) if fields else ())
+
+    def mark_clean(self, *attnames):
+        """Treat the current values of ``attnames`` (all loaded fields if empty) as saved."""
+        deferred = self.get_deferred_fields()
+        attnames = attnames or [field.attname for field in self._meta.concrete_fields if field.attname not in deferred]
+        # Новый словарь, а не update(): копии из objectcache делят исходный
+        self._loaded_values = {**getattr(self, '_loaded_values', {}), **{name: getattr(self, name) for name in attnames}}
+
+    def dirty_fields(self):
+        """Names of changed fields; None for a new instance, which is saved whole."""
+        if self._state.adding or not hasattr(self, '_loaded_values'):
+            return None
+        deferred = self.get_deferred_fields()
+        return {
+            field.attname for field in self._meta.concrete_fields
+            if not field.primary_key and field.attname not in deferred
+            and (field.attname not in self._loaded_values or getattr(self, field.attname) != self._loaded_values[field.attname])
+        }
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None and not self._state.adding:
+            update_fields = self.dirty_fields()
+        if update_fields is not None:
+            update_fields = set(update_fields)
+            if update_fields & set(self.VERSIONED_FIELDS):
+                self.version += 1
+                update_fields.add('version')
+            kwargs['update_fields'] = update_fields
+        super().save(*args, **kwargs)
+        self.mark_clean()
+
+    def save_edit(self, expected_version, **kwargs):
+        """Save changed fields only if the row is still at ``expected_version``."""
+        self.version = expected_version
+        self._expected_version = expected_version
+        try:
+            # Своя точка сохранения: конфликт не ломает внешнюю транзакцию (ATOMIC_REQUESTS, тесты)
+            with transaction.atomic(using=self._state.db or router.db_for_write(type(self), instance=self)):
+                self.save(**kwargs)
+        finally:
+            del self._expected_version
+
+    def _do_update(self, base_qs, using, pk_val, values, update_fields, forced_update):
+        expected = getattr(self, '_expected_version', None)
+        if expected is None:
+            return super()._do_update(base_qs, using, pk_val, values, update_fields, forced_update)
+        # UPDATE ... WHERE id = %s AND version = %s - проверка и запись одним запросом
+        if not super()._do_update(base_qs.filter(version=expected), using, pk_val, values, update_fields, forced_update):
+            raise VersionConflict()
+        return True
+
+
+class Blog(DirtyFieldsMixin, models.Model):
+    VERSIONED_FIELDS = ('title', 'description')
 
-class Blog(models.Model):
     title = models.CharField(max_length=255)
     description = models.TextField()
     owner = models.ForeignKey(User, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(default=None, blank=True, null=True)
     authors = models.ManyToManyField(User, related_name='blogs_as_author')
+    version = models.PositiveIntegerField(default=1)  # Растёт при каждой правке title/description
+    subscribers_count = models.PositiveIntegerField(default=0)  # Ведётся сигналами Subscription в subscriptions.py
+    # Удаление поручено воркеру: блог уже скрыт и закрыт для записи, но строки ещё не удалены
+    is_deleting = models.BooleanField(default=False)
+    # Алиас базы с контентом блога; выбирается при создании и больше не меняется
+    shard = models.CharField(max_length=64, default=new_blog_shard)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id']),
+            models.Index(fields=['is_deleting'], condition=models.Q(is_deleting=True), name='blog_deleting_idx'),
+        ]
 
     def __str__(self):
         return self.title
 
 
-class Post(models.Model):
+class PostLocator(models.Model):
+    # Выдаёт id постов, уникальные на всех шардах, и по id поста находит его блог (а значит и шард)
+    blog = models.ForeignKey(Blog, on_delete=models.CASCADE)
+
+    def __str__(self):
+        return f"Post {self.id} on Blog№{self.blog_id}"
+
+
+class Post(DirtyFieldsMixin, models.Model):
+    VERSIONED_FIELDS = ('title', 'body')
+
     title = models.TextField()
     body = models.TextField()
-    blog = models.ForeignKey(Blog, on_delete=models.CASCADE, related_name='posts')
-    author = models.ForeignKey(User, on_delete=models.CASCADE, default=1)
+    # Пост может лежать на другом шарде, чем блог и пользователь, поэтому без FK-ограничений в базе
+    blog = models.ForeignKey(Blog, on_delete=models.CASCADE, related_name='posts', db_constraint=False)
+    author = models.ForeignKey(User, on_delete=models.CASCADE, default=1, db_constraint=False)
     is_published = models.BooleanField(default=False)
     views = models.IntegerField(default=0)
     created_at = models.DateTimeField(default=None, blank=True, null=True)
     likes = models.ManyToManyField(User, through='Like', related_name='liked_posts')
+    archived_likes_count = models.PositiveIntegerField(default=0)  # Лайки, перенесённые в ArchivedLike
+    archived_comments_count = models.PositiveIntegerField(default=0)
+    # Вычисляются из body при сохранении, чтобы списки не читали полный текст
+    excerpt = models.TextField(blank=True, default='')
+    body_length = models.PositiveIntegerField(default=0)
+    reading_time = models.PositiveIntegerField(default=0)  # минуты
+    version = models.PositiveIntegerField(default=1)  # Растёт при каждой правке title/body
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['is_published', 'created_at', 'id']),
+            # Первые посты блога для general/
+            models.Index(fields=['blog', 'id'], condition=models.Q(is_published=True), name='post_published_blog_idx'),
+        ]
 
     def save(self, *args, **kwargs):
         if self.is_published and self.created_at == None:
             self.created_at = now()
         elif self.is_published == False:
             self.created_at = None
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None:
+            update_fields = self.dirty_fields()
+        if 'body' not in self.get_deferred_fields() and (update_fields is None or 'body' in update_fields):
+            self.fill_excerpt()
+            if update_fields is not None:
+                update_fields = set(update_fields) | {'excerpt', 'body_length', 'reading_time'}
+        if update_fields is not None:
+            kwargs['update_fields'] = update_fields
+        if self.pk is None:
+            self.pk = PostLocator.objects.create(blog_id=self.blog_id).pk
+        kwargs['using'] = shard_for_blog(self.blog_id)
         super().save(*args, **kwargs)
 
+    def fill_excerpt(self):
+        self.excerpt = Truncator(self.body).chars(EXCERPT_LENGTH)
+        self.body_length = len(self.body)
+        words = len(self.body.split())
+        self.reading_time = -(-words // WORDS_PER_MINUTE) if words else 0
+
     def increase_views(self):
+        # Атомарный UPDATE: не перезаписывает остальные поля и не сбрасывает кэш объекта
+        Post.objects.using(self._state.db).filter(pk=self.pk).update(views=models.F('views') + 1)
         self.views += 1
-        self.save()
+        self.mark_clean('views')
+
+    @property
+    def total_likes(self):
+        return Like.objects.using(self._state.db).filter(post_id=self.pk).count() + self.archived_likes_count
 
     def __str__(self):
         return f"Post {self.id} on Blog№{self.blog_id} by {self.author.username} " + ("(draft)" if not self.is_published else "")
 
 
 class Like(models.Model):
-    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_constraint=False)
     post = models.ForeignKey(Post, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         unique_together = ['user', 'post']  # Уникальность лайка пользователя на пост
+        indexes = [models.Index(fields=['created_at'])]
+
+    def save(self, *args, **kwargs):
+        kwargs['using'] = shard_for_post(self.post_id)
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"Like by {self.user.username} on {self.post.title}"
@@ -55,17 +203,143 @@ class Like(models.Model):
 
 class Comment(models.Model):
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='comments')
-    author = models.ForeignKey(User, on_delete=models.CASCADE)
+    author = models.ForeignKey(User, on_delete=models.CASCADE, db_constraint=False)
     body = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [models.Index(fields=['created_at'])]
+
+    def save(self, *args, **kwargs):
+        kwargs['using'] = shard_for_post(self.post_id)
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"Comment by {self.author.username} on {self.post.title}"
 
 
+class ArchivedLike(models.Model):
+    id = models.BigIntegerField(primary_key=True)  # id исходной строки Like
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+', db_constraint=False)
+    post = models.ForeignKey(Post, on_delete=models.CASCADE)
+    created_at = models.DateTimeField()
+    archived_at = models.DateTimeField(default=now)
+
+    class Meta:
+        unique_together = ['user', 'post']
+
+    def __str__(self):
+        return f"Archived like {self.id} on post {self.post_id}"
+
+
+class ArchivedComment(models.Model):
+    id = models.BigIntegerField(primary_key=True)  # id исходной строки Comment
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='archived_comments')
+    author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+', db_constraint=False)
+    body = models.TextField()
+    created_at = models.DateTimeField()
+    archived_at = models.DateTimeField(default=now)
+
+    class Meta:
+        indexes = [models.Index(fields=['post', 'created_at'])]
+
+    def __str__(self):
+        return f"Archived comment {self.id} on post {self.post_id}"
+
+
 class Subscription(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     blog = models.ForeignKey(Blog, on_delete=models.CASCADE)
+    created_at = models.DateTimeField(auto_now_add=True, null=True)  # NULL - подписка старше поля, дата неизвестна
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['user', 'blog'], name='unique_subscription')]
+        # (blog, id) - постраничный список подписчиков блога без сортировки всей выборки
+        indexes = [models.Index(fields=['created_at']), models.Index(fields=['blog', 'id'])]
 
     def __str__(self):
         return f"{self.user.username} subscribed to {self.blog.title}"
+
+
+class Job(models.Model):
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(PENDING, 'Pending'), (RUNNING, 'Running'), (DONE, 'Done'), (FAILED, 'Failed')]
+
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    idempotency_key = models.CharField(max_length=255, unique=True, null=True, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_after = models.DateTimeField(default=now)
+    locked_at = models.DateTimeField(default=None, blank=True, null=True)
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'run_after'])]
+
+    def __str__(self):
+        return f"Job {self.id} {self.name} ({self.status})"
+
+
+class Notification(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notifications')
+    blog = models.ForeignKey(Blog, on_delete=models.CASCADE)
+    # Пост лежит на шарде, поэтому ссылку обнуляет обработчик post_delete в notifications.py
+    post = models.ForeignKey(Post, on_delete=models.DO_NOTHING, blank=True, null=True, db_constraint=False)
+    events_count = models.PositiveIntegerField(default=1)  # Сколько публикаций блога объединено в уведомлении
+    is_read = models.BooleanField(default=False)
+    created_at = models.DateTimeField(default=now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-created_at']),
+            models.Index(fields=['user', 'blog', 'is_read']),
+            models.Index(fields=['created_at']),
+        ]
+
+    def __str__(self):
+        return f"Notification {self.id} for user {self.user_id} on Blog№{self.blog_id}"
+
+
+class NotificationCounter(models.Model):
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='notification_counter')
+    unread = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.unread} unread for user {self.user_id}"
+
+
+class BlogDailyStats(models.Model):
+    blog = models.ForeignKey(Blog, on_delete=models.CASCADE, related_name='daily_stats')
+    date = models.DateField()
+    views = models.PositiveIntegerField(default=0)
+    likes = models.PositiveIntegerField(default=0)
+    comments = models.PositiveIntegerField(default=0)
+    subscribers = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ['blog', 'date']
+
+    def __str__(self):
+        return f"Stats of Blog№{self.blog_id} on {self.date}"
+
+
+class StatsWatermark(models.Model):
+    name = models.CharField(max_length=50, unique=True)  # Таблица-источник, например 'likes'
+    last_id = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name} rolled up to id {self.last_id}"
+
+
+class BlogViewsWatermark(models.Model):
+    blog = models.OneToOneField(Blog, on_delete=models.CASCADE, primary_key=True)
+    views_total = models.BigIntegerField(default=0)  # Сумма Post.views на момент последней свёртки
+
+    def __str__(self):
+        return f"Blog№{self.blog_id} views rolled up to {self.views_total}"
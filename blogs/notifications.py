@@ -0,0 +1,89 @@
+import datetime
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .jobs import job, enqueue, delete_in_batches
+from .models import Post, Subscription, Notification, NotificationCounter
+
+
+def _chunk_size():
+    return getattr(settings, 'NOTIFICATIONS_CHUNK_SIZE', 1000)
+
+
+def schedule_post_notifications(post):
+    enqueue('blogs.notify_subscribers', {'blog_id': post.blog_id, 'post_id': post.id, 'author_id': post.author_id},
+            key=f'notify:{post.id}:0')
+
+
+@receiver(post_delete, sender=Post, dispatch_uid='notifications_post_delete')
+def detach_deleted_post(sender, instance, **kwargs):
+    # Пост может лежать на другом шарде, поэтому SET_NULL делаем сами
+    Notification.objects.filter(post_id=instance.id).update(post=None)
+
+
+@job('blogs.notify_subscribers')
+def notify_subscribers(payload):
+    """Deliver one chunk of subscribers (keyset by subscription id) and enqueue the next chunk."""
+    blog_id, post_id = payload['blog_id'], payload['post_id']
+    after = payload.get('after', 0)
+    rows = list(
+        Subscription.objects.filter(blog_id=blog_id, id__gt=after)
+        .order_by('id').values_list('id', 'user_id')[:_chunk_size()]
+    )
+    if not rows:
+        return
+    user_ids = [user_id for _, user_id in rows if user_id != payload.get('author_id')]
+    current = timezone.now()
+    with transaction.atomic():
+        # Непрочитанное уведомление по этому блогу уже есть - объединяем события в нём
+        pending = Notification.objects.filter(user_id__in=user_ids, blog_id=blog_id, is_read=False)
+        coalesced = set(pending.values_list('user_id', flat=True))
+        pending.update(post_id=post_id, events_count=F('events_count') + 1, created_at=current)
+        fresh = [user_id for user_id in user_ids if user_id not in coalesced]
+        Notification.objects.bulk_create(
+            [Notification(user_id=user_id, blog_id=blog_id, post_id=post_id, created_at=current) for user_id in fresh]
+        )
+        NotificationCounter.objects.bulk_create(
+            [NotificationCounter(user_id=user_id) for user_id in fresh], ignore_conflicts=True
+        )
+        NotificationCounter.objects.filter(user_id__in=fresh).update(unread=F('unread') + 1)
+        last_id = rows[-1][0]
+        enqueue('blogs.notify_subscribers', dict(payload, after=last_id), key=f'notify:{post_id}:{last_id}')
+
+
+def unread_count(user):
+    return NotificationCounter.objects.filter(user_id=user.id).values_list('unread', flat=True).first() or 0
+
+
+def mark_read(user, ids=None):
+    notifications = Notification.objects.filter(user_id=user.id, is_read=False)
+    if ids is not None:
+        notifications = notifications.filter(id__in=ids)
+    with transaction.atomic():
+        updated = notifications.update(is_read=True)
+        if updated:
+            NotificationCounter.objects.filter(user_id=user.id).update(
+                unread=Greatest(F('unread') - updated, Value(0))
+            )
+    return updated
+
+
+def prune_notifications(days=None):
+    """Delete notifications older than the retention period and resync counters of affected users."""
+    days = days if days is not None else getattr(settings, 'NOTIFICATIONS_RETENTION_DAYS', 30)
+    cutoff = timezone.now() - datetime.timedelta(days=days)
+    old = Notification.objects.filter(created_at__lt=cutoff)
+    affected = list(old.filter(is_read=False).values_list('user_id', flat=True).distinct())
+    delete_in_batches(old)
+    unread = Notification.objects.filter(user_id=OuterRef('user_id'), is_read=False) \
+        .values('user_id').annotate(total=Count('id')).values('total')
+    for start in range(0, len(affected), _chunk_size()):
+        NotificationCounter.objects.filter(user_id__in=affected[start:start + _chunk_size()]).update(
+            unread=Coalesce(Subquery(unread), Value(0))
+        )
@@ -0,0 +1,122 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models.signals import post_save, post_delete
+
+from .models import Blog, Post
+from .sharding import GLOBAL_DB, is_sharded, shard_for_post
+
+
+class ObjectCache:
+    """Read-through cache of model instances by pk: a bounded per-process LRU plus an optional shared cache.
+
+    Loads of the same key are serialized on a striped lock, so a hot id missing from the cache
+    costs one query no matter how many threads ask for it at once.
+    """
+    STRIPES = 64
+
+    def __init__(self, model, select_related=(), db_for_pk=None):
+        self.model = model
+        self.select_related = select_related
+        self.db_for_pk = db_for_pk or (lambda pk: GLOBAL_DB)
+        self.prefix = f'objcache:{model._meta.label_lower}:'
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self._stripes = [threading.Lock() for _ in range(self.STRIPES)]
+        post_save.connect(self._invalidate, sender=model, dispatch_uid=f'{self.prefix}save')
+        post_delete.connect(self._invalidate, sender=model, dispatch_uid=f'{self.prefix}delete')
+
+    @property
+    def max_size(self):
+        return getattr(settings, 'OBJECT_CACHE_SIZE', 10000)
+
+    @property
+    def ttl(self):
+        return getattr(settings, 'OBJECT_CACHE_TTL', 60)
+
+    @property
+    def shared(self):
+        alias = getattr(settings, 'OBJECT_CACHE_SHARED', None)
+        return caches[alias] if alias else None
+
+    def _local_get(self, pk):
+        with self._lock:
+            item = self._items.get(pk)
+            if item is None:
+                return None
+            obj, expires = item
+            if expires < time.monotonic():
+                del self._items[pk]
+                return None
+            self._items.move_to_end(pk)
+            return obj
+
+    def _local_set(self, pk, obj):
+        with self._lock:
+            self._items[pk] = (obj, time.monotonic() + self.ttl)
+            self._items.move_to_end(pk)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def get(self, pk):
+        """Return a private copy of the instance with this pk, or None if it does not exist."""
+        pk = int(pk)
+        obj = self._local_get(pk)
+        if obj is None:
+            with self._stripes[pk % self.STRIPES]:
+                obj = self._local_get(pk) or self._load(pk)
+        return copy.copy(obj) if obj is not None else None
+
+    def _load(self, pk):
+        shared = self.shared
+        if shared is not None:
+            obj = shared.get(self.prefix + str(pk))
+            if obj is not None:
+                self._local_set(pk, obj)
+                return obj
+        db = self.db_for_pk(pk)
+        if db is None:
+            return None
+        queryset = self.model.objects.using(db)
+        if db == GLOBAL_DB or not is_sharded():
+            queryset = queryset.select_related(*self.select_related)
+        obj = queryset.filter(pk=pk).first()
+        if obj is not None:
+            self._local_set(pk, obj)
+            if shared is not None:
+                shared.set(self.prefix + str(pk), obj, self.ttl)
+        return obj
+
+    def invalidate(self, pk):
+        with self._lock:
+            self._items.pop(pk, None)
+        shared = self.shared
+        if shared is not None:
+            shared.delete(self.prefix + str(pk))
+
+    def _invalidate(self, sender, instance, **kwargs):
+        self.invalidate(instance.pk)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+post_cache = ObjectCache(Post, select_related=('author',), db_for_pk=shard_for_post)
+blog_cache = ObjectCache(Blog, select_related=('owner',))
+
+
+def get_post(pk):
+    post = post_cache.get(pk)
+    if post is not None and get_blog(post.blog_id) is None:
+        return None  # пост блога, который удаляет воркер
+    return post
+
+
+def get_blog(pk):
+    blog = blog_cache.get(pk)
+    return blog if blog is not None and not blog.is_deleting else None
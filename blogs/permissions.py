@@ -0,0 +1,98 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Q
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Blog
+
+MEMBERS_CACHE_KEY = 'blogs:members:{}'
+
+
+def _cache():
+    # Кэш должен быть общим для всех воркеров (алиас из CACHES, например Redis), иначе
+    # удалённый автор продолжал бы писать через воркеры, не видевшие удаления
+    alias = getattr(settings, 'BLOG_MEMBERS_CACHE', None)
+    return caches[alias] if alias else None
+
+
+def _cache_timeout():
+    # Без общего кэша или с таймаутом 0 проверки идут одним EXISTS запросом
+    if _cache() is None:
+        return 0
+    return getattr(settings, 'BLOG_MEMBERS_CACHE_TIMEOUT', 300)
+
+
+def get_blog_members(blog_id):
+    """Return ``(owner_id, frozenset(author_ids))`` of a blog, or None if it does not exist."""
+    cache = _cache()
+    key = MEMBERS_CACHE_KEY.format(blog_id)
+    members = cache.get(key)
+    if members is not None:
+        return members
+    owner_id = Blog.objects.filter(id=blog_id, is_deleting=False).values_list('owner_id', flat=True).first()
+    if owner_id is None:
+        return None
+    author_ids = Blog.authors.through.objects.filter(blog_id=blog_id).values_list('user_id', flat=True)
+    members = (owner_id, frozenset(author_ids))
+    cache.set(key, members, _cache_timeout())
+    return members
+
+
+def invalidate_blog_members(blog_id):
+    cache = _cache()
+    if cache is not None:
+        cache.delete(MEMBERS_CACHE_KEY.format(blog_id))
+
+
+@receiver(post_save, sender=Blog, dispatch_uid='blog_members_save')
+@receiver(post_delete, sender=Blog, dispatch_uid='blog_members_delete')
+def _blog_changed(sender, instance, **kwargs):
+    # Смена владельца, в том числе из админки
+    invalidate_blog_members(instance.pk)
+
+
+@receiver(m2m_changed, sender=Blog.authors.through, dispatch_uid='blog_members_authors')
+def _authors_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    # reverse - изменение со стороны пользователя (user.blogs_as_author.add(...)), в pk_set id блогов;
+    # для clear их приходится запомнить до удаления
+    if not action.startswith('post_'):
+        if reverse and action == 'pre_clear':
+            instance._cleared_blog_ids = list(instance.blogs_as_author.values_list('id', flat=True))
+        return
+    if not reverse:
+        blog_ids = [instance.pk]
+    elif action == 'post_clear':
+        blog_ids = getattr(instance, '_cleared_blog_ids', ())
+    else:
+        blog_ids = pk_set
+    for blog_id in blog_ids:
+        invalidate_blog_members(blog_id)
+
+
+def blog_exists(blog_id):
+    if _cache_timeout():
+        return get_blog_members(blog_id) is not None
+    return Blog.objects.filter(id=blog_id, is_deleting=False).exists()
+
+
+def can_admin_blog(user, blog_id):
+    if user.id is None:
+        return False
+    if _cache_timeout():
+        members = get_blog_members(blog_id)
+        return members is not None and members[0] == user.id
+    return Blog.objects.filter(id=blog_id, owner_id=user.id, is_deleting=False).exists()
+
+
+def can_write_to_blog(user, blog_id):
+    if user.id is None:
+        return False
+    if _cache_timeout():
+        members = get_blog_members(blog_id)
+        return members is not None and (members[0] == user.id or user.id in members[1])
+    return Blog.objects.filter(Q(owner_id=user.id) | Q(authors__id=user.id), id=blog_id, is_deleting=False).exists()
+
+
+def can_delete_post(user, post):
+    return user.id is not None and (post.author_id == user.id or can_admin_blog(user, post.blog_id))
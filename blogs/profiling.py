@@ -0,0 +1,288 @@
+import contextlib
+import datetime
+import gzip
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+from django.conf import settings
+from django.core import signing
+from django.db import connections
+
+SALT = 'blogs.profiling'
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+# --- Семплирующий профайлер ---
+
+def _frame_name(code):
+    path = code.co_filename
+    base = str(settings.BASE_DIR)
+    if path.startswith(base):
+        path = os.path.relpath(path, base)
+    elif 'site-packages' in path:
+        path = path.split('site-packages' + os.sep, 1)[-1]
+    return f'{code.co_name} ({path}:{code.co_firstlineno})'
+
+
+def _stack(frame, max_depth):
+    names = []
+    while frame is not None and len(names) < max_depth:
+        names.append(_frame_name(frame.f_code))
+        frame = frame.f_back
+    return tuple(reversed(names))
+
+
+class StackSampler:
+    """Background thread that samples the stacks of registered request threads every PROFILING_INTERVAL seconds.
+
+    Unlike cProfile it costs nothing inside the request itself, so every request can be sampled
+    and the samples kept only if the request turns out to be slow.
+    """
+
+    def __init__(self):
+        self._active = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self, thread_id):
+        with self._lock:
+            self._active[thread_id] = Counter()
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='profiling-sampler', daemon=True)
+                self._thread.start()
+
+    def stop(self, thread_id):
+        with self._lock:
+            return self._active.pop(thread_id, Counter())
+
+    def _run(self):
+        interval = _setting('PROFILING_INTERVAL', 0.01)
+        max_depth = _setting('PROFILING_MAX_DEPTH', 64)
+        while True:
+            time.sleep(interval)
+            with self._lock:
+                active = list(self._active.items())
+            if not active:
+                continue
+            frames = sys._current_frames()
+            for thread_id, samples in active:
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    samples[_stack(frame, max_depth)] += 1
+
+
+sampler = StackSampler()
+
+
+class QueryRecorder:
+    def __init__(self, limit):
+        self.limit = limit
+        self.queries = []
+        self.count = 0
+        self.total = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.count += 1
+            self.total += elapsed
+            if len(self.queries) < self.limit:
+                self.queries.append([context['connection'].alias, sql, elapsed])
+
+
+# --- Когда профилировать ---
+
+def make_profile_token():
+    """Value for the PROFILING_HEADER request header; valid for PROFILING_TOKEN_MAX_AGE seconds."""
+    return signing.TimestampSigner(salt=SALT).sign('profile')
+
+
+def _header_requested(request):
+    value = request.headers.get(_setting('PROFILING_HEADER', 'X-Profile'))
+    if not value:
+        return False
+    try:
+        signing.TimestampSigner(salt=SALT).unsign(value, max_age=_setting('PROFILING_TOKEN_MAX_AGE', 3600))
+    except signing.BadSignature:
+        return False
+    return True
+
+
+class ProfilingMiddleware:
+    """Profiles requests slower than PROFILING_SLOW_THRESHOLD, a PROFILING_SAMPLE_RATE fraction of requests,
+    and requests with a signed PROFILING_HEADER; profiles go to the rotating store in PROFILING_DIR.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not _setting('PROFILING_ENABLED', False):
+            return self.get_response(request)
+        if _header_requested(request):
+            reason = 'header'
+        elif random.random() < _setting('PROFILING_SAMPLE_RATE', 0):
+            reason = 'sampled'
+        else:
+            reason = None
+        threshold = _setting('PROFILING_SLOW_THRESHOLD', None)
+        if reason is None and threshold is None:
+            return self.get_response(request)
+
+        thread_id = threading.get_ident()
+        recorder = QueryRecorder(_setting('PROFILING_MAX_QUERIES', 500))
+        sampler.start(thread_id)
+        start = time.perf_counter()
+        try:
+            with contextlib.ExitStack() as wrappers:
+                for connection in connections.all():
+                    wrappers.enter_context(connection.execute_wrapper(recorder))
+                response = self.get_response(request)
+        finally:
+            elapsed = time.perf_counter() - start
+            samples = sampler.stop(thread_id)
+        if reason is None and elapsed >= threshold:
+            reason = 'slow'
+        if reason is not None:
+            match = getattr(request, 'resolver_match', None)
+            profile_id = get_store().save({
+                'view': match.view_name if match is not None else '<unmatched>',
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'reason': reason,
+                'duration': elapsed,
+                'interval': _setting('PROFILING_INTERVAL', 0.01),
+                'samples': [[list(stack), count] for stack, count in samples.items()],
+                'sql_count': recorder.count,
+                'sql_time': recorder.total,
+                'queries': recorder.queries,
+            })
+            if reason == 'header':
+                response['X-Profile-Id'] = profile_id
+        return response
+
+
+# --- Хранилище профилей на диске ---
+
+class ProfileStore:
+    """Gzipped JSON files in a directory, oldest removed past PROFILING_MAX_FILES or PROFILING_MAX_BYTES."""
+
+    def __init__(self, directory, max_files=200, max_bytes=50 * 1024 * 1024):
+        self.directory = directory
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+
+    def save(self, profile):
+        os.makedirs(self.directory, exist_ok=True)
+        profile_id = uuid.uuid4().hex[:12]
+        profile = dict(profile, id=profile_id, created=time.time())
+        # Имя начинается со времени: сортировка по имени - сортировка по возрасту
+        name = f'{datetime.datetime.now().strftime("%Y%m%d%H%M%S%f")}-{profile_id}.json.gz'
+        path = os.path.join(self.directory, name)
+        with gzip.open(f'{path}.tmp', 'wt', encoding='utf-8') as f:
+            json.dump(profile, f)
+        os.replace(f'{path}.tmp', path)
+        self.rotate()
+        return profile_id
+
+    def _files(self):
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(name for name in os.listdir(self.directory) if name.endswith('.json.gz'))
+
+    def rotate(self):
+        # Воркеры могут чистить каталог одновременно, поэтому исчезнувшие файлы не ошибка
+        files = self._files()
+        sizes = {}
+        for name in files:
+            try:
+                sizes[name] = os.path.getsize(os.path.join(self.directory, name))
+            except OSError:
+                sizes[name] = 0
+        total = sum(sizes.values())
+        while files and (len(files) > self.max_files or total > self.max_bytes):
+            name = files.pop(0)
+            total -= sizes[name]
+            with contextlib.suppress(OSError):
+                os.remove(os.path.join(self.directory, name))
+
+    def load(self, name):
+        with gzip.open(os.path.join(self.directory, name), 'rt', encoding='utf-8') as f:
+            return json.load(f)
+
+    def all(self):
+        profiles = []
+        for name in self._files():
+            try:
+                profiles.append(self.load(name))
+            except (OSError, ValueError, EOFError):
+                continue  # файл мог быть удалён ротацией в другом процессе
+        return profiles
+
+    def get(self, profile_id):
+        for name in self._files():
+            if name.endswith(f'-{profile_id}.json.gz'):
+                return self.load(name)
+        return None
+
+
+def get_store():
+    return ProfileStore(
+        _setting('PROFILING_DIR', os.path.join(settings.BASE_DIR, 'profiles')),
+        _setting('PROFILING_MAX_FILES', 200),
+        _setting('PROFILING_MAX_BYTES', 50 * 1024 * 1024),
+    )
+
+
+# --- Сводка и сравнение ---
+
+_SQL_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+
+
+def normalize_sql(sql):
+    return re.sub(r'\s+', ' ', _SQL_LITERALS.sub('?', sql)).strip()
+
+
+def summarize(profiles):
+    """Aggregate profiles: function shares of all samples (self and cumulative) and SQL grouped by statement."""
+    self_samples, cumulative, sql = Counter(), Counter(), {}
+    total_samples = 0
+    for profile in profiles:
+        for stack, count in profile['samples']:
+            total_samples += count
+            if stack:
+                self_samples[stack[-1]] += count
+            for name in set(stack):
+                cumulative[name] += count
+        for alias, statement, elapsed in profile['queries']:
+            entry = sql.setdefault(normalize_sql(statement), [0, 0.0])
+            entry[0] += 1
+            entry[1] += elapsed
+    durations = sorted(profile['duration'] for profile in profiles)
+    n = len(profiles) or 1
+    return {
+        'profiles': len(profiles),
+        'samples': total_samples,
+        'duration_mean': sum(durations) / n,
+        'duration_p50': durations[len(durations) // 2] if durations else 0.0,
+        'duration_max': durations[-1] if durations else 0.0,
+        'sql_count_mean': sum(profile['sql_count'] for profile in profiles) / n,
+        'sql_time_mean': sum(profile['sql_time'] for profile in profiles) / n,
+        'self': {name: count / (total_samples or 1) for name, count in self_samples.items()},
+        'cumulative': {name: count / (total_samples or 1) for name, count in cumulative.items()},
+        'sql': {statement: (count / n, elapsed / n) for statement, (count, elapsed) in sql.items()},
+    }
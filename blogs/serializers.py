@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import Blog, Post, Comment, Subscription
+from .models import Blog, Post, Comment, Subscription, Notification, ArchivedComment
 from django.contrib.auth.models import User
 
 
@@ -44,7 +44,8 @@ class BlogViewSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Blog
-        fields = ('id', 'owner', 'title', 'description', 'created_at', 'updated_at', 'authors')
+        fields = ('id', 'owner', 'title', 'description', 'created_at', 'updated_at', 'authors', 'version',
+                  'subscribers_count')
 
 
 class SubscriptionSerializer(serializers.ModelSerializer):
@@ -57,6 +58,16 @@ class SubscriptionSerializer(serializers.ModelSerializer):
         fields = ('blog_id', 'blog_title', 'author_username')
 
 
+class SubscriberSerializer(serializers.ModelSerializer):
+    user_id = serializers.IntegerField(read_only=True)
+    username = serializers.CharField(source='user.username', read_only=True)
+    subscribed_at = serializers.DateTimeField(source='created_at', read_only=True)
+
+    class Meta:
+        model = Subscription
+        fields = ('user_id', 'username', 'subscribed_at')
+
+
 class CommentSerializer(serializers.ModelSerializer):
     post = serializers.PrimaryKeyRelatedField(read_only=True)
 
@@ -76,8 +87,14 @@ class CommentListSer(serializers.ModelSerializer):
         fields = ('id', 'body', 'created_at', 'author', 'post_id')
 
 
+class ArchivedCommentListSer(CommentListSer):
+    class Meta:
+        model = ArchivedComment
+        fields = ('id', 'body', 'created_at', 'author', 'post_id')
+
+
 class PostViewSerializer(serializers.ModelSerializer):
-    likes_count = serializers.IntegerField(source='likes.count', read_only=True)
+    likes_count = serializers.IntegerField(source='total_likes', read_only=True)
     author = serializers.SerializerMethodField()
 
     def get_author(self, obj):
@@ -85,7 +102,27 @@ class PostViewSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Post
-        fields = ('id', 'title', 'body', 'blog', 'author', 'is_published', 'views', 'likes_count')
+        fields = ('id', 'title', 'body', 'blog', 'author', 'is_published', 'views', 'likes_count', 'version')
+
+
+class BlogEditSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Blog
+        fields = ('title', 'description')
+
+
+class PostEditSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Post
+        fields = ('title', 'body')
+
+
+class PostListViewSerializer(PostViewSerializer):
+    # Для списков: вместо body - сохранённый excerpt, запрос делается с defer('body')
+    class Meta:
+        model = Post
+        fields = ('id', 'title', 'excerpt', 'body_length', 'reading_time', 'blog', 'author', 'is_published', 'views',
+                  'likes_count')
 
 
 class PostSerializer(serializers.ModelSerializer):
@@ -141,18 +178,19 @@ class CommentSecondSerializer(serializers.ModelSerializer):
 class PostSecondSerializer(serializers.ModelSerializer):
     comments = CommentSecondSerializer(many=True)
     author = serializers.SerializerMethodField()
-    likes_count = serializers.IntegerField(source='likes.count', read_only=True)
+    likes_count = serializers.IntegerField(source='total_likes', read_only=True)
 
     def get_author(self, obj):
         return obj.author.username
 
     class Meta:
         model = Post
-        fields = ['id', 'title', 'body', 'is_published', 'likes_count', 'author', 'created_at', 'comments']
+        fields = ['id', 'title', 'excerpt', 'body_length', 'reading_time', 'is_published', 'likes_count', 'author',
+                  'created_at', 'comments']
 
 
 class BlogSecondSerializer(serializers.ModelSerializer):
-    posts = PostSecondSerializer(many=True)
+    posts = serializers.SerializerMethodField()
     owner = serializers.SerializerMethodField()
     authors = serializers.SerializerMethodField()
 
@@ -162,9 +200,13 @@ class BlogSecondSerializer(serializers.ModelSerializer):
     def get_authors(self, obj):
         return [author.username for author in obj.authors.all()]
 
+    def get_posts(self, obj):
+        return PostSecondSerializer(obj.posts.defer('body'), many=True).data
+
     class Meta:
         model = Blog
-        fields = ['id', 'owner', 'title', 'description', 'owner', 'created_at', 'updated_at', 'authors', 'posts']
+        fields = ['id', 'owner', 'title', 'description', 'owner', 'created_at', 'updated_at', 'authors',
+                  'subscribers_count', 'posts']
 
 
 class BlogsGeneralSerializer(serializers.ModelSerializer):
@@ -180,7 +222,18 @@ class BlogsGeneralSerializer(serializers.ModelSerializer):
 
     def get_posts(self, blog):
         N = self.context.get("N")
-        # print()
-        posts = Post.objects.filter(is_published=True, blog=blog)[:N]  # Ограничиваем количество постов для примера
+        if 'posts' in self.context:
+            # Посты уже выбраны одним запросом на шард
+            posts = self.context['posts'].get(blog.id, [])
+        else:
+            posts = blog.posts.filter(is_published=True).defer('body').order_by('id')[:N]  # Ограничиваем количество постов для примера
         post_serializer = PostSecondSerializer(posts, many=True)
         return post_serializer.data
+
+
+class NotificationSerializer(serializers.ModelSerializer):
+    blog_title = serializers.CharField(source='blog.title', read_only=True)
+
+    class Meta:
+        model = Notification
+        fields = ('id', 'blog_id', 'blog_title', 'post_id', 'events_count', 'is_read', 'created_at')
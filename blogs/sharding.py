@@ -0,0 +1,174 @@
+import heapq
+import itertools
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import F
+
+# Контент блога (посты, комментарии, лайки и их архив) живёт на шарде блога,
+# пользователи, блоги и всё остальное - в базе GLOBAL_DB
+CONTENT_MODELS = {'post', 'comment', 'like', 'archivedlike', 'archivedcomment'}
+GLOBAL_DB = DEFAULT_DB_ALIAS
+
+
+def shard_aliases():
+    return getattr(settings, 'BLOG_SHARDS', None) or [GLOBAL_DB]
+
+
+def is_sharded():
+    return len(shard_aliases()) > 1
+
+
+_new_blogs = itertools.count()
+
+
+def new_blog_shard():
+    """Shard for a blog being created: BLOG_NEW_SHARDS (all BLOG_SHARDS by default) in turn."""
+    aliases = getattr(settings, 'BLOG_NEW_SHARDS', None) or shard_aliases()
+    return aliases[next(_new_blogs) % len(aliases)]
+
+
+# Блог не переезжает между шардами, а пост между блогами, поэтому соответствия кэшируются без инвалидации
+_blog_shards = OrderedDict()
+_post_blogs = OrderedDict()
+_locators_lock = threading.Lock()
+
+
+def _remember(locators, key, value):
+    with _locators_lock:
+        locators[key] = value
+        if len(locators) > getattr(settings, 'OBJECT_CACHE_SIZE', 10000):
+            locators.popitem(last=False)
+
+
+def shard_for_blog(blog_id):
+    """Shard stored on the blog row (``Blog.shard``); None if the blog does not exist."""
+    if not is_sharded():
+        return GLOBAL_DB
+    blog_id = int(blog_id)
+    with _locators_lock:
+        shard = _blog_shards.get(blog_id)
+    if shard is None:
+        from .models import Blog
+        shard = Blog.objects.filter(id=blog_id).values_list('shard', flat=True).first()
+        if shard is None:
+            return None
+        _remember(_blog_shards, blog_id, shard)
+    return shard
+
+
+def shard_for_post(post_id):
+    """Shard of a post, found through its PostLocator row; None if the post does not exist."""
+    if not is_sharded():
+        return GLOBAL_DB
+    post_id = int(post_id)
+    with _locators_lock:
+        blog_id = _post_blogs.get(post_id)
+    if blog_id is None:
+        from .models import PostLocator
+        blog_id = PostLocator.objects.filter(id=post_id).values_list('blog_id', flat=True).first()
+        if blog_id is None:
+            return None
+        _remember(_post_blogs, post_id, blog_id)
+    return shard_for_blog(blog_id)
+
+
+def is_content_model(model):
+    return model._meta.app_label == 'blogs' and model._meta.model_name in CONTENT_MODELS
+
+
+def with_users(queryset, *fields):
+    """Load FK users of content rows: a JOIN on a single database, a second query to GLOBAL_DB when sharded."""
+    if is_sharded():
+        return queryset.prefetch_related(*fields)
+    return queryset.select_related(*fields)
+
+
+class BlogShardRouter:
+    def _db_for(self, model, instance=None, **hints):
+        if not is_content_model(model):
+            return GLOBAL_DB
+        if instance is None:
+            return None
+        if is_content_model(type(instance)) and instance._state.db:
+            return instance._state.db
+        if instance._meta.label_lower == 'blogs.blog':
+            return instance.shard if is_sharded() else GLOBAL_DB
+        if getattr(instance, 'blog_id', None) is not None:
+            return shard_for_blog(instance.blog_id)
+        return None
+
+    def db_for_read(self, model, **hints):
+        return self._db_for(model, **hints)
+
+    def db_for_write(self, model, **hints):
+        return self._db_for(model, **hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Контент ссылается на пользователей и блоги из GLOBAL_DB без внешних ключей в базе
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Схема одинаковая на всех базах, чтобы миграции со ссылками между таблицами применялись везде;
+        # на шардах таблицы пользователей и блогов просто остаются пустыми
+        return db == GLOBAL_DB or db in shard_aliases()
+
+
+class ScatterGatherList:
+    """Sliceable view over the same query run on every shard, merged by ``key`` like a single ordered queryset.
+
+    Each shard query must already be ordered by ``key`` (ascending, or descending with ``reverse``);
+    a slice ``[start:stop]`` fetches the first ``stop`` rows of every shard and merges them,
+    iteration merges the full results once.
+    """
+
+    def __init__(self, querysets, key, reverse=False):
+        self.querysets = querysets
+        self.key = key
+        self.reverse = reverse
+
+    def count(self):
+        return sum(queryset.count() for queryset in self.querysets)
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice):
+            return self[item:item + 1][0]
+        start, stop = item.start or 0, item.stop
+        parts = [queryset if stop is None else queryset[:stop] for queryset in self.querysets]
+        merged = heapq.merge(*parts, key=self.key, reverse=self.reverse)
+        return list(itertools.islice(merged, start, stop))
+
+    def __iter__(self):
+        return iter(self[:])
+
+
+def _null_last_key(names):
+    # NULL больше любого значения, как в Postgres; (is None, value) не сравнивает None с datetime
+    def key(obj):
+        values = (getattr(obj, name) for name in names)
+        return tuple(part for value in values for part in (value is None, value))
+    return key
+
+
+def scatter(queryset, order_fields=('id',)):
+    """Run ``queryset`` on every shard ordered by ``order_fields``; returns the queryset itself when not sharded.
+
+    NULLs sort after every value (first when descending) on every backend, the same way the merge compares them.
+    """
+    names = [field.lstrip('-') for field in order_fields]
+    queryset = queryset.order_by(*[
+        F(name).desc(nulls_first=True) if field.startswith('-') else F(name).asc(nulls_last=True)
+        for name, field in zip(names, order_fields)
+    ])
+    if not is_sharded():
+        return queryset
+    return ScatterGatherList(
+        [queryset.using(alias) for alias in shard_aliases()],
+        key=_null_last_key(names),
+        reverse=order_fields[0].startswith('-'),
+    )
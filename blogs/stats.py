@@ -0,0 +1,104 @@
+import datetime
+import itertools
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import Post, Like, Comment, Subscription, BlogDailyStats, StatsWatermark, BlogViewsWatermark
+from .sharding import GLOBAL_DB, is_content_model, shard_aliases
+
+# Поле в BlogDailyStats -> (модель-источник, путь до blog_id)
+SOURCES = {
+    'likes': (Like, 'post__blog_id'),
+    'comments': (Comment, 'post__blog_id'),
+    'subscribers': (Subscription, 'blog_id'),
+}
+
+
+def _add_to_buckets(field, counts):
+    """``counts`` maps ``(blog_id, date)`` to the value added to ``field`` of that day's bucket."""
+    BlogDailyStats.objects.bulk_create(
+        [BlogDailyStats(blog_id=blog_id, date=day) for blog_id, day in counts], ignore_conflicts=True
+    )
+    for (blog_id, day), value in counts.items():
+        BlogDailyStats.objects.filter(blog_id=blog_id, date=day).update(**{field: F(field) + value})
+
+
+def rollup_source(field, batch_size=10000):
+    """Fold rows of one source table created since the watermark into daily buckets."""
+    model, blog_path = SOURCES[field]
+    aliases = shard_aliases() if is_content_model(model) else [GLOBAL_DB]
+    return sum(_rollup_shard(field, alias, batch_size) for alias in aliases)
+
+
+def _rollup_shard(field, alias, batch_size):
+    model, blog_path = SOURCES[field]
+    # id растут независимо на каждом шарде, поэтому и отметка у каждого своя
+    name = field if alias == GLOBAL_DB else f'{field}@{alias}'
+    StatsWatermark.objects.get_or_create(name=name)
+    # Строка с меньшим id может закоммититься позже строки с большим: отметка не заходит дальше
+    # первой строки моложе STATS_ROLLUP_LAG, её транзакция ещё может быть не видна вместе с соседями
+    cutoff = timezone.now() - datetime.timedelta(seconds=getattr(settings, 'STATS_ROLLUP_LAG', 300))
+    processed = 0
+    while True:
+        with transaction.atomic():
+            mark = StatsWatermark.objects.select_for_update().get(name=name)
+            source = model.objects.using(alias)
+            candidates = source.filter(id__gt=mark.last_id).order_by('id').values_list('id', 'created_at')[:batch_size]
+            # Строки без даты (подписки старше поля created_at) пропускаются, в статистику они не попадают
+            old = itertools.takewhile(lambda row: row[1] is None or row[1] < cutoff, candidates)
+            ids = [row_id for row_id, created_at in old]
+            if not ids:
+                return processed
+            rows = source.filter(id__gt=mark.last_id, id__lte=ids[-1], created_at__isnull=False) \
+                .annotate(day=TruncDate('created_at')).values(blog_path, 'day').annotate(total=Count('id')) \
+                .order_by()
+            _add_to_buckets(field, {(row[blog_path], row['day']): row['total'] for row in rows})
+            mark.last_id = ids[-1]
+            mark.save(update_fields=['last_id'])
+        processed += len(ids)
+
+
+def rollup_views():
+    """Post.views is a plain counter, so the growth since the previous run goes into today's bucket."""
+    # Сумма считается по всем постам каждый запуск: у счётчика нет отметки времени изменения
+    today = timezone.localdate()
+    totals = {}
+    for alias in shard_aliases():
+        totals.update(
+            Post.objects.using(alias).values('blog_id').annotate(total=Sum('views')).order_by()
+            .values_list('blog_id', 'total')
+        )
+    with transaction.atomic():
+        seen = dict(
+            BlogViewsWatermark.objects.select_for_update().filter(blog_id__in=totals)
+            .values_list('blog_id', 'views_total')
+        )
+        counts = {}
+        # Блог без отметки появился после миграции 0015_stats_history: все его просмотры новые
+        for blog_id, total in totals.items():
+            delta = total - seen.get(blog_id, 0)
+            if delta > 0:
+                counts[(blog_id, today)] = delta
+        _add_to_buckets('views', counts)
+        BlogViewsWatermark.objects.bulk_create(
+            [BlogViewsWatermark(blog_id=blog_id) for blog_id in totals if blog_id not in seen]
+        )
+        for blog_id, total in totals.items():
+            if total != seen.get(blog_id):
+                BlogViewsWatermark.objects.filter(blog_id=blog_id).update(views_total=total)
+
+
+def rollup_all(batch_size=10000):
+    rollup_views()
+    return {field: rollup_source(field, batch_size) for field in SOURCES}
+
+
+def blog_stats(blog_id, start, end):
+    buckets = BlogDailyStats.objects.filter(blog_id=blog_id, date__gte=start, date__lte=end).order_by('date')
+    series = list(buckets.values('date', 'views', 'likes', 'comments', 'subscribers'))
+    totals = {name: sum(row[name] for row in series) for name in ('views', 'likes', 'comments', 'subscribers')}
+    return {'blog_id': blog_id, 'start_date': start, 'end_date': end, 'totals': totals, 'series': series}
@@ -0,0 +1,45 @@
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Blog, Subscription
+from .objectcache import blog_cache
+
+
+def _add_subscribers(blog_id, delta):
+    blogs = Blog.objects.filter(id=blog_id)
+    if delta < 0:
+        blogs = blogs.filter(subscribers_count__gte=-delta)  # не уходим ниже нуля, если счётчик уже разошёлся
+    blogs.update(subscribers_count=F('subscribers_count') + delta)
+    transaction.on_commit(lambda: blog_cache.invalidate(blog_id))
+
+
+# Счётчик ведётся по сигналам, поэтому его не обходят ни админка (в том числе массовое удаление),
+# ни каскадное удаление пользователя или блога
+@receiver(post_save, sender=Subscription, dispatch_uid='subscriptions_count_save')
+def _subscription_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        _add_subscribers(instance.blog_id, 1)
+
+
+@receiver(post_delete, sender=Subscription, dispatch_uid='subscriptions_count_delete')
+def _subscription_deleted(sender, instance, **kwargs):
+    _add_subscribers(instance.blog_id, -1)
+
+
+def subscribe(user, blog_id):
+    """Returns False if the user is already subscribed; the row and the counter change in one transaction."""
+    with transaction.atomic():
+        try:
+            with transaction.atomic():
+                Subscription.objects.create(user=user, blog_id=blog_id)
+        except IntegrityError:
+            return False
+    return True
+
+
+def unsubscribe(user, blog_id):
+    with transaction.atomic():
+        _, deleted = Subscription.objects.filter(user=user, blog_id=blog_id).delete()
+    return deleted.get(Subscription._meta.label, 0) > 0
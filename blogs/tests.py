@@ -1,3 +1,777 @@
-from django.test import TestCase
+import datetime
+import shutil
+import tempfile
+import threading
+from importlib import import_module
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.apps import apps as django_apps
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import connections
+from django.db.migrations.recorder import MigrationRecorder
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import get_resolver
+from django.utils import timezone
+from rest_framework.response import Response
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework.views import APIView
+
+from blogs import hashers, jobs, metrics, sharding
+from blogs.archive import archive_likes
+from blogs.models import Blog, Post, Like, Subscription, Job, Notification, BlogDailyStats, StatsWatermark, VersionConflict
+from blogs.objectcache import blog_cache, get_blog, get_post, post_cache
+from blogs.permissions import can_admin_blog, can_write_to_blog
+from blogs.profiling import ProfilingMiddleware, get_store, make_profile_token
+from blogs.stats import rollup_all, rollup_source
+from blogs.subscriptions import subscribe, unsubscribe
+from blogs.throttling import AnonBucketThrottle, CacheBucketStore, EndpointBucketThrottle, MemoryBucketStore, \
+    RateLimitHeadersMiddleware
+
+
+class BlogsTestCase(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        # Кэши живут дольше транзакции теста, а SQLite повторно выдаёт те же id
+        for cache in caches.all():
+            cache.clear()
+        post_cache.clear()
+        blog_cache.clear()
+        sharding._post_blogs.clear()
+        sharding._blog_shards.clear()
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+
+@override_settings(BLOG_MEMBERS_CACHE='shared')
+class BlogMembersCacheTests(BlogsTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.owner = User.objects.create_user('owner')
+        self.author = User.objects.create_user('author')
+        self.blog = Blog.objects.create(owner=self.owner, title='t', description='d')
+
+    def test_author_changes_invalidate(self):
+        self.assertFalse(can_write_to_blog(self.author, self.blog.id))
+        self.blog.authors.add(self.author)
+        self.assertTrue(can_write_to_blog(self.author, self.blog.id))
+        self.blog.authors.remove(self.author)
+        self.assertFalse(can_write_to_blog(self.author, self.blog.id))
+
+    def test_reverse_clear_invalidates(self):
+        self.blog.authors.add(self.author)
+        self.assertTrue(can_write_to_blog(self.author, self.blog.id))
+        self.author.blogs_as_author.clear()
+        self.assertFalse(can_write_to_blog(self.author, self.blog.id))
+
+    def test_owner_change_invalidates(self):
+        self.assertTrue(can_admin_blog(self.owner, self.blog.id))
+        self.blog.owner = self.author
+        self.blog.save()
+        self.assertFalse(can_admin_blog(self.owner, self.blog.id))
+        self.assertTrue(can_admin_blog(self.author, self.blog.id))
+
+    @override_settings(BLOG_MEMBERS_CACHE=None)
+    def test_without_shared_cache_checks_database(self):
+        self.blog.authors.add(self.author)
+        with self.assertNumQueries(1):
+            self.assertTrue(can_write_to_blog(self.author, self.blog.id))
+
+
+class JobTests(BlogsTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.calls = []
+        jobs.HANDLERS['tests.record'] = self.calls.append
+        jobs.HANDLERS['tests.fail'] = self._fail
+        self.addCleanup(jobs.HANDLERS.pop, 'tests.record')
+        self.addCleanup(jobs.HANDLERS.pop, 'tests.fail')
+
+    def _fail(self, payload):
+        raise RuntimeError('boom')
+
+    def test_key_makes_enqueue_idempotent(self):
+        first = jobs.enqueue('tests.record', {'n': 1}, key='k')
+        second = jobs.enqueue('tests.record', {'n': 2}, key='k')
+        self.assertEqual(first.id, second.id)
+        self.assertEqual(jobs.run_pending(), 1)
+        self.assertEqual(self.calls, [{'n': 1}])
+
+    def test_claimed_job_is_not_claimed_again(self):
+        jobs.enqueue('tests.record')
+        self.assertEqual(len(jobs.claim_jobs(10)), 1)
+        self.assertEqual(jobs.claim_jobs(10), [])
+
+    def test_stale_lock_is_reclaimed(self):
+        job_ = jobs.enqueue('tests.record')
+        Job.objects.filter(id=job_.id).update(status=Job.RUNNING, locked_at=timezone.now() - datetime.timedelta(hours=1))
+        self.assertEqual([claimed.id for claimed in jobs.claim_jobs(10)], [job_.id])
+
+    @override_settings(JOBS_RETRY_BACKOFF=5)
+    def test_failure_is_retried_with_backoff_then_fails(self):
+        job_ = jobs.enqueue('tests.fail', max_attempts=2)
+        jobs.run_pending()
+        job_.refresh_from_db()
+        self.assertEqual((job_.status, job_.attempts), (Job.PENDING, 1))
+        self.assertGreater(job_.run_after, timezone.now())
+        self.assertIn('boom', job_.last_error)
+        self.assertEqual(jobs.run_pending(), 0)
+        Job.objects.filter(id=job_.id).update(run_after=timezone.now())
+        with self.assertLogs('blogs.jobs', 'ERROR'):
+            jobs.run_pending()
+        job_.refresh_from_db()
+        self.assertEqual((job_.status, job_.attempts), (Job.FAILED, 2))
+
+    def test_prune_keeps_recent_and_pending_jobs(self):
+        old = timezone.now() - datetime.timedelta(days=30)
+        done = jobs.enqueue('tests.record')
+        pending = jobs.enqueue('tests.record')
+        recent = jobs.enqueue('tests.record')
+        Job.objects.filter(id=done.id).update(status=Job.DONE, run_after=old)
+        Job.objects.filter(id=pending.id).update(run_after=old)
+        Job.objects.filter(id=recent.id).update(status=Job.DONE)
+        self.assertEqual(jobs.prune_jobs(7), 1)
+        self.assertEqual(set(Job.objects.values_list('id', flat=True)), {pending.id, recent.id})
+
+
+@override_settings(BLOG_SYNC_DELETE_MAX_POSTS=0)
+class BlogDeletionTests(BlogsTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.owner = User.objects.create_user('owner')
+        self.reader = User.objects.create_user('reader')
+        self.blog = Blog.objects.create(owner=self.owner, title='t', description='d')
+        self.post = Post.objects.create(blog=self.blog, author=self.owner, title='p', body='b', is_published=True)
+        Subscription.objects.create(user=self.reader, blog=self.blog)
+
+    def test_blog_is_closed_until_worker_deletes_it(self):
+        owner, reader = self.client_for(self.owner), self.client_for(self.reader)
+        self.assertEqual(reader.get(f'/api/posts/{self.post.id}/').status_code, 200)  # кэшируем пост и блог
+        self.assertEqual(owner.delete(f'/api/blogs/{self.blog.id}/').status_code, 202)
+
+        self.assertEqual(reader.get(f'/api/blogs/{self.blog.id}/').status_code, 404)
+        self.assertEqual(reader.get(f'/api/posts/{self.post.id}/').status_code, 404)
+        self.assertEqual(reader.get('/api/posts/').json()['results'], [])
+        self.assertEqual(reader.get('/api/blogs/').json()['results'], [])
+        response = owner.post('/api/post/', {'blog': self.blog.id, 'title': 'late', 'body': 'b'})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.client_for(self.owner).post(f'/api/subscriptions/{self.blog.id}/').status_code, 404)
+
+        self.assertEqual(jobs.run_pending(), 1)
+        self.assertFalse(Blog.objects.filter(id=self.blog.id).exists())
+        self.assertFalse(Post.objects.using(sharding.shard_for_blog(self.blog.id)).filter(blog_id=self.blog.id).exists())
+        self.assertFalse(Subscription.objects.filter(blog_id=self.blog.id).exists())
+
+
+class StatsRollupTests(BlogsTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.owner = User.objects.create_user('owner')
+        self.blog = Blog.objects.create(owner=self.owner, title='t', description='d')
+
+    def _subscribe(self, username, age):
+        subscription = Subscription.objects.create(user=User.objects.create_user(username), blog=self.blog)
+        Subscription.objects.filter(id=subscription.id).update(created_at=timezone.now() - age)
+        return subscription
+
+    def _subscribers(self):
+        return sum(BlogDailyStats.objects.filter(blog=self.blog).values_list('subscribers', flat=True))
+
+    @override_settings(STATS_ROLLUP_LAG=300)
+    def test_watermark_waits_for_rows_inside_lag(self):
+        # Младший id ещё "в полёте", старший уже старше лага: отметка не должна его перепрыгнуть
+        recent = self._subscribe('a', datetime.timedelta(seconds=10))
+        self._subscribe('b', datetime.timedelta(hours=1))
+        self.assertEqual(rollup_source('subscribers'), 0)
+        self.assertEqual(StatsWatermark.objects.get(name='subscribers').last_id, 0)
+
+        Subscription.objects.filter(id=recent.id).update(created_at=timezone.now() - datetime.timedelta(hours=1))
+        self.assertEqual(rollup_source('subscribers'), 2)
+        self.assertEqual(self._subscribers(), 2)
+        self.assertEqual(rollup_source('subscribers'), 0)
+        self.assertEqual(self._subscribers(), 2)
+
+    @override_settings(STATS_ROLLUP_LAG=0)
+    def test_first_rollup_counts_only_activity_after_migration(self):
+        post = Post.objects.create(blog=self.blog, author=self.owner, title='p', body='b', is_published=True)
+        Post.objects.using(post._state.db).filter(id=post.id).update(views=100)
+        old = self._subscribe('old', datetime.timedelta(0))
+        # Всё созданное выше существовало до 0004_blog_stats; данные готовит 0015_stats_history
+        MigrationRecorder(connections['default']).migration_qs.filter(app='blogs', name='0004_blog_stats') \
+            .update(applied=timezone.now())
+        history = import_module('blogs.migrations.0015_stats_history')
+        history.seed_stats_history(django_apps, connections['default'].schema_editor())
+
+        Post.objects.using(post._state.db).filter(id=post.id).update(views=105)
+        self._subscribe('new', datetime.timedelta(0))
+        rollup_all()
+
+        self.assertIsNone(Subscription.objects.get(id=old.id).created_at)
+        stats = BlogDailyStats.objects.get(blog=self.blog)
+        self.assertEqual((stats.date, stats.views, stats.subscribers), (timezone.localdate(), 5, 1))
+
+
+class BucketStoreTests(TestCase):
+
+    def test_memory_bucket_refills(self):
+        store = MemoryBucketStore()
+        self.assertEqual([store.consume('k', 3, 1, 100.0)[0] for _ in range(4)], [True, True, True, False])
+        self.assertTrue(store.consume('k', 3, 1, 101.0)[0])
+        self.assertFalse(store.consume('k', 3, 1, 101.0)[0])
+
+    @override_settings(THROTTLE_CACHE='shared')
+    def test_cache_store_is_atomic_across_workers(self):
+        caches['shared'].clear()
+        now = 1000.0
+        results = []
+
+        def worker():
+            # Каждый поток со своим экземпляром хранилища, как отдельный процесс
+            results.append(CacheBucketStore().consume('k', 5, 5 / 60, now)[0])
+
+        threads = [threading.Thread(target=worker) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results.count(True), 5)
+
+    @override_settings(THROTTLE_CACHE='shared')
+    def test_cache_store_window_slides(self):
+        caches['shared'].clear()
+        store = CacheBucketStore()
+        start = 600.0  # начало окна в 60 секунд
+        self.assertEqual([store.consume('k', 2, 2 / 60, start)[0] for _ in range(3)], [True, True, False])
+        # Через половину следующего окна от прошлого остаётся половина: доступен один запрос
+        self.assertEqual([store.consume('k', 2, 2 / 60, start + 90)[0] for _ in range(2)], [True, False])
+        self.assertTrue(store.consume('k', 2, 2 / 60, start + 180)[0])
+
+
+@override_settings(OBJECT_CACHE_SHARED='shared')
+class ArchiveTests(BlogsTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.owner = User.objects.create_user('owner')
+        self.reader = User.objects.create_user('reader')
+        self.blog = Blog.objects.create(owner=self.owner, title='t', description='d')
+        self.post = Post.objects.create(blog=self.blog, author=self.owner, title='p', body='b', is_published=True)
+        self.db = sharding.shard_for_blog(self.blog.id)
+        like = Like.objects.create(user=self.reader, post=self.post)
+        Like.objects.using(self.db).filter(id=like.id).update(created_at=timezone.now() - datetime.timedelta(days=400))
+
+    def _likes(self):
+        return self.client_for(self.reader).get(f'/api/posts/{self.post.id}/').json()['likes_count']
+
+    def test_archiving_keeps_cached_counts_correct(self):
+        self.assertEqual(self._likes(), 1)
+        self.assertEqual(archive_likes(365), 1)
+        self.assertEqual(self._likes(), 1)
+        self.assertEqual(Post.objects.using(self.db).get(id=self.post.id).archived_likes_count, 1)
+
+    def test_unlike_archived_updates_cached_count(self):
+        archive_likes(365)
+        self.assertEqual(self._likes(), 1)
+        response = self.client_for(self.reader).delete(f'/api/posts/{self.post.id}/like/')
+        self.assertIn(response.status_code, (200, 204))
+        self.assertEqual(self._likes(), 0)
+
+
+class ShardingTests(BlogsTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('user')
+        self.blogs = [Blog.objects.create(owner=self.user, title=f'b{i}', description='d') for i in range(2)]
+        self.assertNotEqual(*[sharding.shard_for_blog(blog.id) for blog in self.blogs])
+
+    def _post(self, blog, title, published=True, created_at=None):
+        post = Post.objects.create(blog=blog, author=self.user, title=title, body='b', is_published=published)
+        if created_at is not None:
+            Post.objects.using(post._state.db).filter(id=post.id).update(created_at=created_at)
+        return post
+
+    def test_content_is_routed_to_blog_shard(self):
+        for blog in self.blogs:
+            post = self._post(blog, 'p')
+            shard = sharding.shard_for_blog(blog.id)
+            self.assertEqual(post._state.db, shard)
+            self.assertEqual(sharding.shard_for_post(post.id), shard)
+            like = Like.objects.create(user=self.user, post=post)
+            self.assertTrue(Like.objects.using(shard).filter(id=like.id).exists())
+            other = next(alias for alias in sharding.shard_aliases() if alias != shard)
+            self.assertFalse(Post.objects.using(other).filter(id=post.id).exists())
+        # id постов уникальны на всех шардах
+        ids = [post.id for alias in sharding.shard_aliases() for post in Post.objects.using(alias).all()]
+        self.assertEqual(len(ids), len(set(ids)))
+
+    def test_routing_follows_stored_shard(self):
+        # Шард хранится в блоге, поэтому изменение BLOG_SHARDS не переносит существующие блоги
+        with override_settings(BLOG_NEW_SHARDS=['shard1']):
+            blogs = [Blog.objects.create(owner=self.user, title='t', description='d') for _ in range(2)]
+        with override_settings(BLOG_SHARDS=['shard1', 'default']):
+            for blog in blogs:
+                self.assertEqual(blog.shard, 'shard1')
+                self.assertEqual(sharding.shard_for_blog(blog.id), 'shard1')
+                self.assertEqual(self._post(blog, 'p')._state.db, 'shard1')
+        self.assertEqual(self.client_for(self.user).get(f'/api/blogs/{blogs[0].id}/posts/').status_code, 200)
+
+    def test_deleting_user_removes_content_on_every_shard(self):
+        reader = User.objects.create_user('reader')
+        with override_settings(BLOG_NEW_SHARDS=['shard1']):
+            own_blog = Blog.objects.create(owner=reader, title='t', description='d')
+        own_post = Post.objects.create(blog=own_blog, author=reader, title='own', body='b', is_published=True)
+        Like.objects.create(user=self.user, post=own_post)
+        for blog in self.blogs:
+            post = self._post(blog, 'p')
+            Like.objects.create(user=reader, post=post)
+            Post.objects.create(blog=blog, author=reader, title='guest', body='b', is_published=True)
+
+        reader.delete()
+
+        for alias in sharding.shard_aliases():
+            self.assertFalse(Post.objects.using(alias).filter(author_id=reader.id).exists())
+            self.assertFalse(Post.objects.using(alias).filter(blog_id=own_blog.id).exists())
+            self.assertFalse(Like.objects.using(alias).filter(user_id=reader.id).exists())
+            self.assertFalse(Like.objects.using(alias).filter(post_id=own_post.id).exists())
+        response = self.client_for(self.user).get('/api/posts/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Post.objects.using('default').count() + Post.objects.using('shard1').count(), 2)
+
+    def test_admin_changelist_loads_users_and_blogs_in_bulk(self):
+        admin_user = User.objects.create_superuser('admin', password='pw')
+        self.client.force_login(admin_user)
+
+        def changelist_queries():
+            with CaptureQueriesContext(connections['default']) as default, \
+                    CaptureQueriesContext(connections['shard1']) as shard1:
+                response = self.client.get('/admin/blogs/post/?shard=shard1')
+            self.assertEqual(response.status_code, 200)
+            return len(default), len(shard1)
+
+        def add_posts(count):
+            # Разные авторы и блоги, чтобы N+1 по каждой связи был виден
+            for i in range(count):
+                author = User.objects.create_user(f'author{Post.objects.using("shard1").count()}')
+                with override_settings(BLOG_NEW_SHARDS=['shard1']):
+                    blog = Blog.objects.create(owner=author, title='t', description='d')
+                Post.objects.create(blog=blog, author=author, title=f'p{i}', body='b', is_published=True)
+
+        add_posts(2)
+        few = changelist_queries()
+        add_posts(18)
+        response = self.client.get('/admin/blogs/post/?shard=shard1')
+        self.assertContains(response, 'author19')
+        self.assertEqual(changelist_queries(), few)
+
+    def test_scatter_merges_shards_in_order_with_drafts(self):
+        now = timezone.now()
+        expected = [
+            self._post(self.blogs[0], 'draft 0', published=False),
+            self._post(self.blogs[1], 'draft 1', published=False),
+            self._post(self.blogs[1], 'new', created_at=now),
+            self._post(self.blogs[0], 'middle', created_at=now - datetime.timedelta(hours=1)),
+            self._post(self.blogs[1], 'old', created_at=now - datetime.timedelta(hours=2)),
+        ]
+        # Черновики (created_at IS NULL) первыми, между собой по -id
+        expected[:2] = sorted(expected[:2], key=lambda post: -post.id)
+        posts = sharding.scatter(Post.objects.all(), ('-created_at', '-id'))
+        self.assertEqual([post.title for post in posts], [post.title for post in expected])
+        self.assertEqual([post.title for post in posts[1:3]], [post.title for post in expected[1:3]])
+
+    def test_user_posts_query_each_shard_once(self):
+        for i in range(10):
+            self._post(self.blogs[i % 2], f'p{i}', published=i % 3 != 0)
+        with CaptureQueriesContext(connections['default']) as default, \
+                CaptureQueriesContext(connections['shard1']) as shard1:
+            response = self.client_for(self.user).get('/api/myposts/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 10)
+        for queries in (default, shard1):
+            self.assertEqual(len([q for q in queries if 'FROM "blogs_post"' in q['sql']]), 1)
+
+    def test_general_returns_first_published_posts_of_each_blog(self):
+        for blog in self.blogs:
+            for i in range(4):
+                self._post(blog, f'{blog.title} p{i}', published=i != 1)
+        response = self.client_for(self.user).get('/api/general/?N=2')
+        posts = {blog['title']: [post['title'] for post in blog['posts']] for blog in response.json()}
+        self.assertEqual(posts, {'b0': ['b0 p0', 'b0 p2'], 'b1': ['b1 p0', 'b1 p2']})
+
+
+class MetricsTests(BlogsTestCase):
+
+    def setUp(self):
+        super().setUp()
+        metrics.registry.clear()
+        self.owner = User.objects.create_user('owner')
+        self.blog = Blog.objects.create(owner=self.owner, title='t', description='d')
+
+    def test_url_names_are_unique(self):
+        names = [pattern.name for pattern in get_resolver('blogs.urls').url_patterns if pattern.name]
+        self.assertEqual(len(names), len(set(names)))
+
+    def test_detail_views_have_separate_series(self):
+        client = self.client_for(self.owner)
+        client.get(f'/api/blogs/{self.blog.id}/')
+        client.get(f'/api/detailblog/{self.blog.id}/')
+        client.get(f'/api/detailblog/{self.blog.id}/')
+        counters, histograms = metrics.registry.snapshot()
+        requests = {dict(labels)['view']: value for (name, labels), value in counters.items()
+                    if name == 'http_requests_total'}
+        self.assertEqual(requests, {'blog-detail': 1, 'blog-second-detail': 2})
+
+
+class SubscriberCountTests(BlogsTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.owner = User.objects.create_user('owner')
+        self.blog = Blog.objects.create(owner=self.owner, title='t', description='d')
+        self.readers = [User.objects.create_user(f'reader{i}') for i in range(3)]
+
+    def _count(self):
+        return Blog.objects.get(id=self.blog.id).subscribers_count
+
+    def test_api_subscribe_and_unsubscribe(self):
+        client = self.client_for(self.readers[0])
+        self.assertEqual(client.post(f'/api/subscriptions/{self.blog.id}/').status_code, 201)
+        self.assertEqual(client.post(f'/api/subscriptions/{self.blog.id}/').status_code, 400)
+        self.assertEqual(self._count(), 1)
+        self.assertEqual(self.client_for(self.owner).get(f'/api/blogs/{self.blog.id}/').json()['subscribers_count'], 1)
+        client.delete(f'/api/subscriptions/{self.blog.id}/')
+        client.delete(f'/api/subscriptions/{self.blog.id}/')
+        self.assertEqual(self._count(), 0)
+
+    def test_admin_add_and_bulk_delete(self):
+        admin_user = User.objects.create_superuser('admin', password='x')
+        self.client.force_login(admin_user)
+        for reader in self.readers:
+            response = self.client.post('/admin/blogs/subscription/add/', {'user': reader.id, 'blog': self.blog.id})
+            self.assertEqual(response.status_code, 302)
+        self.assertEqual(self._count(), 3)
+        ids = list(Subscription.objects.values_list('id', flat=True)[:2])
+        response = self.client.post('/admin/blogs/subscription/', {
+            'action': 'delete_selected', '_selected_action': ids, 'post': 'yes',
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self._count(), 1)
+
+    def test_user_deletion_and_underflow(self):
+        for reader in self.readers:
+            subscribe(reader, self.blog.id)
+        self.readers[0].delete()
+        self.assertEqual(self._count(), 2)
+        Blog.objects.filter(id=self.blog.id).update(subscribers_count=0)  # счётчик разошёлся
+        self.assertTrue(unsubscribe(self.readers[1], self.blog.id))
+        self.assertEqual(self._count(), 0)
+
+    def test_subscribers_listing_pages_by_cursor(self):
+        for reader in self.readers:
+            subscribe(reader, self.blog.id)
+        client = self.client_for(self.owner)
+        self.assertEqual(self.client_for(self.readers[0]).get(f'/api/blogs/{self.blog.id}/subscribers/').status_code, 403)
+        page = client.get(f'/api/blogs/{self.blog.id}/subscribers/?page_size=2').json()
+        self.assertEqual(page['subscribers_count'], 3)
+        names = [row['username'] for row in page['results']]
+        names += [row['username'] for row in client.get(page['next']).json()['results']]
+        self.assertEqual(names, ['reader2', 'reader1', 'reader0'])
+
+
+class VersioningTests(BlogsTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.owner = User.objects.create_user('owner')
+        self.blog = Blog.objects.create(owner=self.owner, title='t', description='d')
+        self.post = Post.objects.create(blog=self.blog, author=self.owner, title='p', body='b', is_published=True)
+        self.client = self.client_for(self.owner)
+
+    def test_patch_requires_version_and_detects_conflicts(self):
+        url = f'/api/posts/{self.post.id}/'
+        response = self.client.get(url)
+        version = response.json()['version']
+        self.assertEqual(response['ETag'], f'"{version}"')
+        self.assertEqual(self.client.patch(url, {'title': 'x'}).status_code, 428)
+        response = self.client.patch(url, {'title': 'first'}, HTTP_IF_MATCH=f'"{version}"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['version'], version + 1)
+        response = self.client.patch(url, {'title': 'stale'}, HTTP_IF_MATCH=f'"{version}"')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['version'], version + 1)
+        self.assertEqual(Post.objects.using(self.post._state.db).get(id=self.post.id).title, 'first')
+
+    def test_save_edit_with_stale_version_raises(self):
+        stale = Blog.objects.get(id=self.blog.id)
+        fresh = Blog.objects.get(id=self.blog.id)
+        fresh.title = 'fresh'
+        fresh.save_edit(fresh.version)
+        stale.title = 'stale'
+        with self.assertRaises(VersionConflict):
+            stale.save_edit(stale.version)
+        self.assertEqual(Blog.objects.get(id=self.blog.id).title, 'fresh')
+
+    def test_save_writes_only_changed_fields(self):
+        stale = Post.objects.using(self.post._state.db).get(id=self.post.id)
+        self.client.get(f'/api/posts/{self.post.id}/')  # views + 1 атомарным UPDATE
+        stale.title = 'admin edit'
+        with CaptureQueriesContext(connections[stale._state.db]) as queries:
+            stale.save()
+        updates = [query['sql'] for query in queries if query['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+        self.assertNotIn('"views"', updates[0])
+        fresh = Post.objects.using(stale._state.db).get(id=self.post.id)
+        self.assertEqual((fresh.title, fresh.views, fresh.version), ('admin edit', 1, stale.version))
+
+    def test_patch_writes_value_equal_to_stale_cached_copy(self):
+        url = f'/api/posts/{self.post.id}/'
+        self.client.get(url)  # в кэше процесса title 'p', версия 1
+        # Правка через другой воркер: update() не сбрасывает кэш этого процесса
+        Post.objects.using(self.post._state.db).filter(id=self.post.id).update(title='B', version=2)
+        response = self.client.patch(url, {'title': 'p'}, HTTP_IF_MATCH='"2"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.json()['title'], response.json()['version']), ('p', 3))
+        fresh = Post.objects.using(self.post._state.db).get(id=self.post.id)
+        self.assertEqual((fresh.title, fresh.version), ('p', 3))
+
+
+@override_settings(NOTIFICATIONS_CHUNK_SIZE=2)
+class NotificationTests(BlogsTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.owner = User.objects.create_user('owner')
+        self.blog = Blog.objects.create(owner=self.owner, title='t', description='d')
+        self.readers = [User.objects.create_user(f'reader{i}') for i in range(5)]
+        for user in [self.owner] + self.readers:
+            subscribe(user, self.blog.id)
+
+    def _publish(self, title):
+        response = self.client_for(self.owner).post(
+            '/api/post/', {'blog': self.blog.id, 'title': title, 'body': 'b', 'is_published': 'true'}
+        )
+        self.assertEqual(response.status_code, 201)
+        while jobs.run_pending():
+            pass
+
+    def test_subscribers_are_notified_in_chunks_and_coalesced(self):
+        self._publish('first')
+        self._publish('second')
+        reader = self.client_for(self.readers[4])
+        self.assertEqual(reader.get('/api/notifications/unread_count/').json(), {'unread': 1})
+        [notification] = reader.get('/api/notifications/').json()['results']
+        self.assertEqual(notification['events_count'], 2)
+        self.assertEqual(Notification.objects.filter(blog=self.blog).count(), 5)
+        self.assertFalse(Notification.objects.filter(user=self.owner).exists())
+        self.assertEqual(reader.post('/api/notifications/read/').json(), {'marked_read': 1, 'unread': 0})
+
+
+class ObjectCacheTests(BlogsTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.owner = User.objects.create_user('owner')
+        self.blog = Blog.objects.create(owner=self.owner, title='t', description='d')
+        self.post = Post.objects.create(blog=self.blog, author=self.owner, title='p', body='b', is_published=True)
+
+    def test_hits_are_private_copies_and_saves_invalidate(self):
+        first = get_post(self.post.id)
+        with self.assertNumQueries(0, using='default'), self.assertNumQueries(0, using='shard1'):
+            second = get_post(self.post.id)
+        second.title = 'changed locally'
+        self.assertEqual(get_post(self.post.id).title, 'p')
+        first.title = 'saved'
+        first.save()
+        self.assertEqual(get_post(self.post.id).title, 'saved')
+        self.assertIsNone(get_post(self.post.id + 1000))
+
+    def test_owner_change_from_another_worker_is_respected(self):
+        new_owner = User.objects.create_user('new owner')
+        self.assertEqual(self.client_for(self.owner).get(f'/api/blogs/{self.blog.id}/authors/').status_code, 200)
+        # Другой воркер сменил владельца: его post_save не сбросил LRU этого процесса
+        Blog.objects.filter(id=self.blog.id).update(owner=new_owner)
+        self.assertEqual(get_blog(self.blog.id).owner_id, self.owner.id)
+        old = self.client_for(self.owner)
+        self.assertEqual(old.get(f'/api/blogs/{self.blog.id}/authors/').status_code, 403)
+        self.assertEqual(old.post(f'/api/blogs/{self.blog.id}/authors/', {'author_names': 'author'}).status_code, 403)
+        self.assertEqual(old.get(f'/api/blogs/{self.blog.id}/subscribers/').status_code, 403)
+        self.assertEqual(self.client_for(new_owner).get(f'/api/blogs/{self.blog.id}/subscribers/').status_code, 200)
+
+
+class ListingTests(BlogsTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.owner = User.objects.create_user('owner')
+        self.blog = Blog.objects.create(owner=self.owner, title='t', description='d')
+        self.post = Post.objects.create(blog=self.blog, author=self.owner, title='p', body='word ' * 450,
+                                        is_published=True)
+        Post.objects.using(self.post._state.db).filter(id=self.post.id) \
+            .update(created_at=timezone.make_aware(datetime.datetime(2024, 5, 10, 12)))
+
+    def _titles(self, query):
+        response = self.client_for(self.owner).get(f'/api/posts/{query}')
+        return response.status_code, [post['title'] for post in response.json().get('results', [])]
+
+    def test_date_window_is_inclusive_and_validated(self):
+        self.assertEqual(self._titles('?start_date=2024-05-10&end_date=2024-05-10'), (200, ['p']))
+        self.assertEqual(self._titles('?start_date=2024-05-11'), (200, []))
+        self.assertEqual(self._titles('?end_date=2024-05-09'), (200, []))
+        self.assertEqual(self._titles('?start_date=2024-05-11&end_date=2024-05-10')[0], 400)
+        self.assertEqual(self._titles('?start_date=yesterday')[0], 400)
+
+    def test_lists_return_excerpt_instead_of_body(self):
+        [post] = self.client_for(self.owner).get('/api/posts/').json()['results']
+        self.assertNotIn('body', post)
+        self.assertEqual((post['body_length'], post['reading_time']), (450 * 5, 3))
+        self.assertLessEqual(len(post['excerpt']), 300)
+
+
+
+class RateLimitHeaderTests(TestCase):
+
+    @override_settings(REST_FRAMEWORK={'DEFAULT_THROTTLE_RATES': {'anon': '3/min', 'listing': '2/min'}})
+    def test_denying_throttle_sets_headers(self):
+        class ListingView(APIView):
+            permission_classes = []
+            authentication_classes = []
+            throttle_classes = [AnonBucketThrottle, EndpointBucketThrottle]
+            throttle_scope = 'listing'
+
+            def get(self, request):
+                return Response({})
+
+        view = RateLimitHeadersMiddleware(ListingView.as_view())
+
+        def request():
+            # Свой адрес, чтобы не делить вёдра процесса с другими тестами
+            return APIRequestFactory().get('/', REMOTE_ADDR='10.0.0.32')
+
+        self.assertEqual(view(request()).status_code, 200)
+        self.assertEqual(view(request()).status_code, 200)
+        # Оба лимита исчерпаны (remaining 0), отказал listing - заголовки должны быть его
+        response = view(request())
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['X-RateLimit-Limit'], '2')
+        self.assertEqual(response['X-RateLimit-Remaining'], '0')
+
+
+@override_settings(PASSWORD_HASHERS=['blogs.hashers.ConfigurablePBKDF2PasswordHasher'], PASSWORD_HASH_ITERATIONS=1000)
+class PasswordHashingTests(BlogsTestCase):
+
+    def setUp(self):
+        super().setUp()
+        # Пул создаётся один раз на процесс; каждому тесту - свой, под его настройки
+        for name in ('_executor', '_slots'):
+            patcher = mock.patch.object(hashers, name, None)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(lambda: hashers._executor and hashers._executor.shutdown())
+
+    def login(self, password='pw'):
+        return APIClient().post('/api/token/', {'username': 'u', 'password': password}, format='json')
+
+    def test_login_rehashes_after_iterations_change(self):
+        User.objects.create_user('u', password='pw')
+        with override_settings(PASSWORD_HASH_ITERATIONS=2000):
+            self.assertEqual(self.login().status_code, 200)
+        self.assertTrue(User.objects.get(username='u').password.startswith('pbkdf2_sha256$2000$'))
+
+    @override_settings(PASSWORD_HASH_MAX_PENDING=1, PASSWORD_HASH_QUEUE_TIMEOUT=0.01)
+    def test_full_queue_returns_503(self):
+        User.objects.create_user('u', password='pw')
+        _, slots = hashers._pool()
+        slots.acquire()  # единственное место занято другим входом
+        try:
+            response = self.login()
+        finally:
+            slots.release()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(self.login().status_code, 200)
+
+    @override_settings(PASSWORD_HASH_MAX_PENDING=2, PASSWORD_HASH_QUEUE_TIMEOUT=0)
+    def test_benchmark_caps_threads(self):
+        out, err = StringIO(), StringIO()
+        call_command('benchmark_logins', logins=8, threads=20, stdout=out, stderr=err)
+        self.assertIn('logins=8 threads=2 ', out.getvalue())
+        self.assertIn('PASSWORD_HASH_MAX_PENDING=2', err.getvalue())
+
+
+class ProfilingTests(TestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, True)
+        self.enterContext(override_settings(
+            PROFILING_ENABLED=True, PROFILING_DIR=directory, PROFILING_SAMPLE_RATE=0, PROFILING_SLOW_THRESHOLD=None,
+        ))
+        self.store = get_store()
+
+    def request(self, **headers):
+        middleware = ProfilingMiddleware(lambda request: HttpResponse('ok'))
+        return middleware(RequestFactory().get('/api/posts/', headers=headers))
+
+    def profile(self, view, duration, stack, sql):
+        return self.store.save({
+            'view': view, 'method': 'GET', 'path': '/', 'status': 200, 'reason': 'sampled', 'duration': duration,
+            'interval': 0.01, 'samples': [[stack, 10]], 'sql_count': 1, 'sql_time': 0.002,
+            'queries': [['default', sql, 0.002]],
+        })
+
+    def test_nothing_saved_without_trigger(self):
+        self.request()
+        with override_settings(PROFILING_SLOW_THRESHOLD=60):
+            self.request()
+        self.assertEqual(self.store.all(), [])
+
+    def test_slow_threshold(self):
+        with override_settings(PROFILING_SLOW_THRESHOLD=0):
+            self.request()
+        self.assertEqual([profile['reason'] for profile in self.store.all()], ['slow'])
+
+    def test_sample_rate(self):
+        with override_settings(PROFILING_SAMPLE_RATE=0.5), mock.patch('blogs.profiling.random.random', return_value=0.4):
+            self.request()
+        with override_settings(PROFILING_SAMPLE_RATE=0.5), mock.patch('blogs.profiling.random.random', return_value=0.6):
+            self.request()
+        self.assertEqual([profile['reason'] for profile in self.store.all()], ['sampled'])
+
+    def test_signed_header(self):
+        self.assertNotIn('X-Profile-Id', self.request(**{'X-Profile': 'forged'}))
+        response = self.request(**{'X-Profile': make_profile_token()})
+        profile = self.store.get(response['X-Profile-Id'])
+        self.assertEqual(profile['reason'], 'header')
+        self.assertEqual(len(self.store.all()), 1)
+
+    def test_rotation_keeps_newest(self):
+        self.store.max_files = 3
+        ids = [self.profile('v', 0.1, ['a'], 'SELECT 1') for _ in range(5)]
+        self.assertEqual([profile['id'] for profile in self.store.all()], ids[2:])
+
+    def test_summary_and_diff(self):
+        self.profile('before', 0.1, ['view (v.py:1)', 'slow (v.py:5)'], 'SELECT * FROM post WHERE id = 1')
+        self.profile('after', 0.05, ['view (v.py:1)', 'fast (v.py:9)'], 'SELECT * FROM post WHERE id = 2')
+
+        out = StringIO()
+        call_command('profiles', 'summary', 'before', stdout=out)
+        self.assertIn('1 profile(s), 10 samples; duration mean 100.0 ms', out.getvalue())
+        self.assertIn('100.0%  slow (v.py:5)', out.getvalue())
+        self.assertIn('SELECT * FROM post WHERE id = ?', out.getvalue())
+
+        out = StringIO()
+        call_command('profiles', 'diff', 'before', 'after', stdout=out)
+        self.assertIn('duration mean 100.0 -> 50.0 ms', out.getvalue())
+        self.assertIn('100.0% ->    0.0% (-100.0)  slow (v.py:5)', out.getvalue())
+        self.assertIn('100.0% ->  100.0% (+0.0)  view (v.py:1)', out.getvalue())
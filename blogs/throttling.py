@@ -0,0 +1,183 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+
+class MemoryBucketStore:
+    """Per-process token buckets; the least recently used keys are dropped past ``max_keys``."""
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def consume(self, key, capacity, refill_rate, now):
+        with self._lock:
+            tokens, last = self._buckets.pop(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - last) * refill_rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return allowed, tokens
+
+
+class CacheBucketStore:
+    """Limits shared by all workers through a Django cache (Redis, memcached); THROTTLE_CACHE picks the alias.
+
+    Read-modify-write of a bucket is not atomic across workers, so the bucket is approximated with
+    a sliding window: atomic ``incr`` counters of the current and previous window, the previous one
+    weighted by how much of it still overlaps the last ``capacity / refill_rate`` seconds.
+    """
+
+    def __init__(self):
+        self.cache = caches[getattr(settings, 'THROTTLE_CACHE', 'default')]
+
+    def _incr(self, key, delta, timeout):
+        self.cache.add(key, 0, timeout)
+        try:
+            return self.cache.incr(key, delta)
+        except ValueError:
+            # Ключ истёк между add и incr
+            self.cache.add(key, 0, timeout)
+            return self.cache.incr(key, delta)
+
+    def consume(self, key, capacity, refill_rate, now):
+        window = capacity / refill_rate
+        index = int(now // window)
+        current_key = f'{key}:{index}'
+        timeout = math.ceil(window * 2) + 1
+        used = self._incr(current_key, 1, timeout)
+        previous = self.cache.get(f'{key}:{index - 1}', 0)
+        weight = 1 - (now - index * window) / window
+        tokens = capacity - (previous * weight + used)
+        allowed = tokens >= 0
+        if not allowed:
+            # Отклонённый запрос не расходует лимит
+            self._incr(current_key, -1, timeout)
+        return allowed, max(tokens, 0.0)
+
+
+def parse_rate(rate):
+    """``'60/min'`` -> ``(60, 60)``: requests allowed and the period in seconds, as in DRF."""
+    num, period = rate.split('/')
+    return int(num), {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}[period[0]]
+
+
+@lru_cache(maxsize=None)
+def get_bucket_store():
+    return import_string(getattr(settings, 'THROTTLE_BUCKET_STORE', 'blogs.throttling.MemoryBucketStore'))()
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """Token bucket with capacity and refill taken from a DEFAULT_THROTTLE_RATES entry such as ``'60/min'``."""
+    scope = None
+
+    def get_scope(self, view):
+        return self.scope
+
+    def get_key(self, request, view):
+        raise NotImplementedError
+
+    def allow_request(self, request, view):
+        scope = self.get_scope(view)
+        rate = api_settings.DEFAULT_THROTTLE_RATES.get(scope) if scope else None
+        key = self.get_key(request, view) if rate else None
+        if key is None:
+            return True
+        capacity, duration = parse_rate(rate)
+        self.refill_rate = capacity / duration
+        allowed, self.tokens = get_bucket_store().consume(
+            f'throttle:{scope}:{key}', capacity, self.refill_rate, time.time()
+        )
+        reset = math.ceil((capacity - self.tokens) / self.refill_rate)
+        _remember_limit(request, capacity, int(self.tokens), reset, denied=not allowed)
+        return allowed
+
+    def wait(self):
+        return max(0.0, (1 - self.tokens) / self.refill_rate)
+
+
+def _remember_limit(request, limit, remaining, reset, denied):
+    # Заголовки отдаёт RateLimitHeadersMiddleware по самому строгому из сработавших лимитов
+    http_request = request._request
+    current = getattr(http_request, 'rate_limit', None)
+    candidate = (limit, remaining, reset, denied)
+    if current is None or _stricter(candidate, current):
+        http_request.rate_limit = candidate
+
+
+def _stricter(limit, other):
+    # Отказавший лимит всегда важнее пропустивших, из отказавших - с самым долгим ожиданием, как Retry-After
+    if limit[3] != other[3]:
+        return limit[3]
+    if limit[3]:
+        return limit[2] > other[2]
+    return limit[1] < other[1]
+
+
+class AnonBucketThrottle(TokenBucketThrottle):
+    scope = 'anon'
+
+    def get_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            return None
+        return self.get_ident(request)
+
+
+class UserBucketThrottle(TokenBucketThrottle):
+    scope = 'user'
+
+    def get_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            return request.user.pk
+        return None
+
+
+class WriteBucketThrottle(TokenBucketThrottle):
+    """Separate budget for POST/PUT/PATCH/DELETE: likes, comments, posts."""
+    scope = 'write'
+
+    def get_key(self, request, view):
+        if request.method in ('GET', 'HEAD', 'OPTIONS'):
+            return None
+        if request.user and request.user.is_authenticated:
+            return request.user.pk
+        return self.get_ident(request)
+
+
+class EndpointBucketThrottle(TokenBucketThrottle):
+    """Per-endpoint budget for views that set ``throttle_scope``."""
+
+    def get_scope(self, view):
+        return getattr(view, 'throttle_scope', None)
+
+    def get_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            return request.user.pk
+        return self.get_ident(request)
+
+
+class RateLimitHeadersMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        rate_limit = getattr(request, 'rate_limit', None)
+        if rate_limit is not None:
+            limit, remaining, reset, _ = rate_limit
+            response['X-RateLimit-Limit'] = str(limit)
+            response['X-RateLimit-Remaining'] = str(max(remaining, 0))
+            response['X-RateLimit-Reset'] = str(reset)
+        return response
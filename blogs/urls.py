@@ -1,11 +1,12 @@
 from django.urls import path
 
 from .views import BlogCreateView, BlogSubscriptionAPIView, BlogDetailAPIView, \
-    MyBlogListAPIView, BlogSecondDetailView, BlogsNewListView
+    MyBlogListAPIView, BlogSecondDetailView, BlogsNewListView, BlogStatsView, BlogSubscribersView
 from .views import AuthorsView, LikePostAPIView, CommentCreateAPIView, CommentListAPIView, CommentDelete
 from .views import PostListCreateAPIView, PostDetailAPIView, CreatePostAPIView, PostsListView, PostPublishAPIView
 from .views import GeneralAPIView
 from .views import UserPostsView, UserRegistrationView
+from .views import NotificationListView, NotificationUnreadCountView, NotificationReadView
 
 urlpatterns = [
     path('blog/', BlogCreateView.as_view(), name='blog-create'),
@@ -13,8 +14,10 @@ urlpatterns = [
     path('blogs/<int:blog_id>/', BlogDetailAPIView.as_view(), name='blog-detail'),
     path('blogs/<int:blog_id>/posts/', PostListCreateAPIView.as_view(), name='post-list-create'),
     path('blogs/<int:blog_id>/authors/', AuthorsView.as_view(), name='blog-authors'),  # Get post Delete
+    path('blogs/<int:blog_id>/stats/', BlogStatsView.as_view(), name='blog-stats'),
+    path('blogs/<int:blog_id>/subscribers/', BlogSubscribersView.as_view(), name='blog-subscribers'),
     path('myblogs/', MyBlogListAPIView.as_view(), name='blogs-user-list'),
-    path('detailblog/<int:blog_id>/', BlogSecondDetailView.as_view(), name='blog-detail'),
+    path('detailblog/<int:blog_id>/', BlogSecondDetailView.as_view(), name='blog-second-detail'),
 
     path('post/', CreatePostAPIView.as_view(), name='post-create'),
 
@@ -32,6 +35,10 @@ urlpatterns = [
     path('subscriptions/', BlogSubscriptionAPIView.as_view(), name='blog-subscriptions'),
     path('subscriptions/<int:blog_id>/', BlogSubscriptionAPIView.as_view(), name='blog-subscription-detail'),
 
+    path('notifications/', NotificationListView.as_view(), name='notifications-list'),
+    path('notifications/unread_count/', NotificationUnreadCountView.as_view(), name='notifications-unread-count'),
+    path('notifications/read/', NotificationReadView.as_view(), name='notifications-read'),
+
     path('register/', UserRegistrationView.as_view(), name='user_registration'),
     path('general/', GeneralAPIView.as_view(), name='main-page'),
 
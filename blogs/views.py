@@ -1,17 +1,23 @@
 import datetime
 
-from .models import Blog, Post, Comment, Like, Subscription
+from .models import Blog, Post, Comment, Like, Subscription, Notification, ArchivedLike, ArchivedComment, \
+    VersionConflict
 from django.contrib.auth.models import User
 from django.utils import timezone
-from django.db.models import Count
-
-from django.shortcuts import get_object_or_404
+from django.utils.dateparse import parse_date, parse_datetime
+from django.db import connections
+from django.db.models import Count, F, OuterRef, Subquery, Sum, Window
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Coalesce, RowNumber
+from django.conf import settings
+
+from django.http import Http404
 from rest_framework.response import Response
 from rest_framework import permissions, status, serializers
 from rest_framework.views import APIView
 from rest_framework.generics import ListAPIView, RetrieveAPIView, RetrieveDestroyAPIView, \
     CreateAPIView, DestroyAPIView, UpdateAPIView
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import PageNumberPagination, CursorPagination
 
 
 class MyPagination(PageNumberPagination):
@@ -20,10 +26,109 @@ class MyPagination(PageNumberPagination):
     max_page_size = 10
 
 
+class SubscribersPagination(CursorPagination):
+    # Keyset по id: страница - это WHERE blog_id = %s AND id < курсор, сколько бы ни было подписчиков
+    ordering = '-id'
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+
+def _query_date(request, name):
+    value = request.query_params.get(name)
+    if not value:
+        return None
+    parsed = parse_date(value)
+    if parsed is None:
+        raise ValueError(value)
+    return parsed
+
+
+def _query_datetime(request, name):
+    """Parse a date or datetime query param; returns ``(aware datetime, is_whole_day)`` or ``(None, False)``."""
+    value = request.query_params.get(name)
+    if not value:
+        return None, False
+    day = parse_date(value)
+    if day is not None:
+        return timezone.make_aware(datetime.datetime.combine(day, datetime.time.min)), True
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise ValueError(value)
+    return (parsed if timezone.is_aware(parsed) else timezone.make_aware(parsed)), False
+
+
+def _date_window(request, field='created_at'):
+    """Filter kwargs for start_date/end_date; an open side adds no condition, a date-only end_date is inclusive."""
+    start, _ = _query_datetime(request, 'start_date')
+    end, whole_day = _query_datetime(request, 'end_date')
+    kw = {}
+    if start is not None:
+        kw[f'{field}__gte'] = start
+    if end is not None:
+        if whole_day:
+            kw[f'{field}__lt'] = end + datetime.timedelta(days=1)
+        else:
+            kw[f'{field}__lte'] = end
+    if start is not None and end is not None and start > end:
+        raise ValueError('start_date is after end_date')
+    return kw
+
+
+def _archived_blog_total(field):
+    # Подзапрос, а не Sum по JOIN: иначе сумма умножится на число лайков/комментариев
+    total = Post.objects.filter(blog=OuterRef('pk')).order_by().values('blog').annotate(total=Sum(field)).values('total')
+    return Coalesce(Subquery(total), 0)
+
+
 from .serializers import BlogSerializer, UserSerializer, PostSerializer, \
     CommentSerializer, CommentListSer, UserViewSerializer, \
     SubscriptionSerializer, PostViewSerializer, BlogViewSerializer, BlogSecondSerializer, \
-    BlogsGeneralSerializer, PostSecondSerializer
+    BlogsGeneralSerializer, PostSecondSerializer, NotificationSerializer, ArchivedCommentListSer, PostListViewSerializer, \
+    BlogEditSerializer, PostEditSerializer, SubscriberSerializer
+from .permissions import blog_exists, can_admin_blog, can_write_to_blog, can_delete_post
+from .jobs import schedule_blog_delete, schedule_blog_touch, delete_blog
+from .notifications import schedule_post_notifications, unread_count, mark_read
+from .stats import blog_stats
+from .objectcache import get_post, get_blog, post_cache
+from .archive import unlike_archived
+from .subscriptions import subscribe, unsubscribe
+from .sharding import is_sharded, scatter, shard_aliases, shard_for_blog, shard_for_post, with_users
+
+
+def _expected_version(request):
+    """Version the client edits from: ``If-Match: "3"`` or ``version`` in the body; None if not given."""
+    value = request.headers.get('If-Match') or request.data.get('version')
+    if value is None:
+        return None
+    return int(str(value).removeprefix('W/').strip('"'))
+
+
+def _save_edit(instance, request, serializer_class, view_serializer_class):
+    try:
+        version = _expected_version(request)
+    except ValueError:
+        return Response({'error': 'Invalid version'}, status=status.HTTP_400_BAD_REQUEST)
+    if version is None:
+        return Response({'error': 'Send the version being edited in If-Match or "version"'},
+                        status=status.HTTP_428_PRECONDITION_REQUIRED)
+    serializer = serializer_class(instance, data=request.data, partial=True)
+    serializer.is_valid(raise_exception=True)
+    # Копия из кэша объектов может отставать от базы: правим свежую строку и пишем все присланные поля,
+    # даже совпадающие с загруженными, - иначе значение из устаревшей копии молча не записалось бы
+    instance = type(instance).objects.using(instance._state.db).filter(pk=instance.pk).first()
+    if instance is None:
+        raise Http404
+    for field, value in serializer.validated_data.items():
+        setattr(instance, field, value)
+    try:
+        instance.save_edit(version, update_fields=set(serializer.validated_data))
+    except VersionConflict:
+        current = type(instance).objects.using(instance._state.db).filter(pk=instance.pk) \
+            .values_list('version', flat=True).first()
+        return Response({'error': 'Changed by someone else, reload and retry', 'version': current},
+                        status=status.HTTP_409_CONFLICT)
+    return Response(view_serializer_class(instance).data, headers={'ETag': f'"{instance.version}"'})
 
 
 class BlogCreateView(CreateAPIView):
@@ -53,22 +158,21 @@ class CreatePostAPIView(CreateAPIView):
         is_published = self.request.data.get('is_published')
         if is_published and is_published.lower() == 'true':
             post = serializer.save()
-            blog = post.blog
-            blog.updated_at = timezone.now()
-            blog.save()
+            schedule_blog_touch(post.blog_id, post.created_at, post.id)
+            schedule_post_notifications(post)
         else:
             serializer.save(created_at=None)
 
     def create(self, request, *args, **kwargs):
         if "blog" not in request.data.keys():
             return Response({'error': 'No blog'}, status=status.HTTP_403_FORBIDDEN)
-        blog_id = request.data.get('blog')
         try:
-            blog = Blog.objects.get(id=blog_id)
-        except:
+            blog_id = int(request.data.get('blog'))
+        except (TypeError, ValueError):
             return Response({'error': 'Blog not found'}, status=status.HTTP_404_NOT_FOUND)
-        user = request.user
-        if user == blog.owner or user in blog.authors.all():
+        if not blog_exists(blog_id):
+            return Response({'error': 'Blog not found'}, status=status.HTTP_404_NOT_FOUND)
+        if can_write_to_blog(request.user, blog_id):
             return super().create(request, *args, **kwargs)
         else:
             return Response({'error': 'Access denied'}, status=status.HTTP_403_FORBIDDEN)
@@ -80,8 +184,7 @@ class PostDeleteAPIView(DestroyAPIView):
 
     def delete(self, request, *args, **kwargs):
         post = self.get_object()
-        user = request.user
-        if post.author == user or post.blog.owner == user:
+        if can_delete_post(request.user, post):
             return self.destroy(request, *args, **kwargs)
         else:
             return Response(status=status.HTTP_403_FORBIDDEN)
@@ -90,7 +193,7 @@ class CommentDelete(APIView):
 
     def delete(self, request, post_id,comment_id):
         try:
-            comment = Comment.objects.get(id=comment_id,post_id=post_id)
+            comment = Comment.objects.using(shard_for_post(post_id)).get(id=comment_id,post_id=post_id)
         except Comment.DoesNotExist:
             return Response({'error': 'Comment not found'}, status=status.HTTP_404_NOT_FOUND)
         if request.user != comment.author:
@@ -105,7 +208,19 @@ class CommentListAPIView(ListAPIView):
 
     def get_queryset(self):
         post_id = self.kwargs['pk']
-        return Comment.objects.filter(post_id=post_id)
+        db = shard_for_post(post_id)
+        if db is None:
+            return Comment.objects.none()
+        if self._archived():
+            return with_users(ArchivedComment.objects.using(db).filter(post_id=post_id), 'author').order_by('created_at')
+        return with_users(Comment.objects.using(db).filter(post_id=post_id), 'author')
+
+    def get_serializer_class(self):
+        return ArchivedCommentListSer if self._archived() else CommentListSer
+
+    def _archived(self):
+        # ?archived=true - старые комментарии, перенесённые командой archive_activity
+        return self.request.query_params.get('archived', '').lower() in ('1', 'true')
 
 
 class CommentCreateAPIView(CreateAPIView):
@@ -134,27 +249,25 @@ class CommentDetailAPIView(DestroyAPIView):
 
 class AuthorsView(APIView):
     def get(self, request, blog_id):
-        try:
-            blog = Blog.objects.get(id=blog_id)
-        except Blog.DoesNotExist:
+        blog = get_blog(blog_id)
+        if blog is None:
             return Response({'error': 'Blog not found'}, status=status.HTTP_404_NOT_FOUND)
-        if blog.owner != request.user:
+        if not can_admin_blog(request.user, blog.id):
             return Response({'error': 'Only the blog owner can see authors'}, status=status.HTTP_403_FORBIDDEN)
         authors = blog.authors.all()
         serializer = UserViewSerializer(authors, many=True)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
     def post(self, request, blog_id):
-        try:
-            blog = Blog.objects.get(id=blog_id)
-        except Blog.DoesNotExist:
+        blog = get_blog(blog_id)
+        if blog is None:
             return Response({'error': 'Blog not found'}, status=status.HTTP_404_NOT_FOUND)
-        if blog.owner != request.user:
+        if not can_admin_blog(request.user, blog.id):
             return Response({'error': 'Only the blog owner can add authors'}, status=status.HTTP_403_FORBIDDEN)
         author_names = request.data.get('author_names')
         if not author_names:
             return Response({'error': 'No parameter author_names'}, status=status.HTTP_400_BAD_REQUEST)
-        authors = User.objects.exclude(username=blog.owner).filter(username__in=author_names.split(','))
+        authors = User.objects.exclude(id=request.user.id).filter(username__in=author_names.split(','))
         if not authors:
             return Response({'error': 'No find author names'}, status=status.HTTP_400_BAD_REQUEST)
         blog.authors.add(*authors)
@@ -163,11 +276,10 @@ class AuthorsView(APIView):
         return Response(serializer.data, status=status.HTTP_200_OK)
 
     def delete(self, request, blog_id):
-        try:
-            blog = Blog.objects.get(id=blog_id)
-        except Blog.DoesNotExist:
+        blog = get_blog(blog_id)
+        if blog is None:
             return Response({'error': 'Blog not found'}, status=status.HTTP_404_NOT_FOUND)
-        if blog.owner != request.user:
+        if not can_admin_blog(request.user, blog.id):
             return Response({'error': 'Only the blog owner can remove authors'}, status=status.HTTP_403_FORBIDDEN)
         author_names = request.data.get('author_names')
         if not author_names:
@@ -183,28 +295,29 @@ class AuthorsView(APIView):
 
 class LikePostAPIView(APIView):
     def post(self, request, post_id):
-        try:
-            post = Post.objects.get(id=post_id)
-        except Post.DoesNotExist:
+        post = get_post(post_id)
+        if post is None:
             return Response({'error': 'Post not found'}, status=status.HTTP_404_NOT_FOUND)
         if not request.user.is_authenticated:
             return Response({'error': 'Authentication required'}, status=status.HTTP_401_UNAUTHORIZED)
-        if Like.objects.filter(user=request.user, post=post).exists():
+        if Like.objects.using(post._state.db).filter(user_id=request.user.id, post_id=post.id).exists() or \
+                ArchivedLike.objects.using(post._state.db).filter(user_id=request.user.id, post_id=post.id).exists():
             return Response({'error': 'User has already liked this post'}, status=status.HTTP_400_BAD_REQUEST)
         like = Like(user=request.user, post=post)
         like.save()
         return Response({'message': 'Post liked successfully'}, status=status.HTTP_201_CREATED)
 
     def delete(self, request, post_id):
-        try:
-            post = Post.objects.get(id=post_id)
-        except Post.DoesNotExist:
+        post = get_post(post_id)
+        if post is None:
             return Response({'error': 'Post not found'}, status=status.HTTP_404_NOT_FOUND)
         if not request.user.is_authenticated:
             return Response({'error': 'Authentication required'}, status=status.HTTP_401_UNAUTHORIZED)
         try:
-            like = Like.objects.get(user=request.user, post=post)
+            like = Like.objects.using(post._state.db).get(user_id=request.user.id, post_id=post.id)
         except Like.DoesNotExist:
+            if unlike_archived(request.user, post):
+                return Response({'message': 'Post unliked successfully'}, status=status.HTTP_200_OK)
             return Response({'error': 'User has not liked this post'}, status=status.HTTP_400_BAD_REQUEST)
         like.delete()
         return Response({'message': 'Post unliked successfully'}, status=status.HTTP_200_OK)
@@ -214,7 +327,9 @@ class BlogSubscriptionAPIView(APIView):
     def get(self, request):
         if not request.user.is_authenticated:
             return Response({'error': 'User not authorized'}, status=status.HTTP_401_UNAUTHORIZED)
-        subscriptions = Subscription.objects.filter(user=request.user)
+        # Блог и его владелец приходят тем же запросом, что и подписки
+        subscriptions = Subscription.objects.filter(user=request.user).select_related('blog__owner') \
+            .only('blog__title', 'blog__owner__username').order_by('id')
         serializer = SubscriptionSerializer(subscriptions, many=True)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
@@ -223,22 +338,18 @@ class BlogSubscriptionAPIView(APIView):
             return Response({'error': 'Blog_id not found'}, status=status.HTTP_404_NOT_FOUND)
         if not request.user:
             return Response({'error': 'User not authorized'}, status=status.HTTP_401_UNAUTHORIZED)
-        try:
-            blog = Blog.objects.get(id=blog_id)
-        except Blog.DoesNotExist:
+        blog = get_blog(blog_id)
+        if blog is None:
             return Response({'error': 'Blog not found'}, status=status.HTTP_404_NOT_FOUND)
-        if Subscription.objects.filter(user=request.user, blog=blog).exists():
+        if not subscribe(request.user, blog.id):
             return Response({'error': 'Already subscribed to this blog'}, status=status.HTTP_400_BAD_REQUEST)
-        subscription = Subscription(user=request.user, blog=blog)
-        subscription.save()
         return Response({'status': 'ok'}, status=status.HTTP_201_CREATED)
 
     def delete(self, request, blog_id):
-        try:
-            blog = Blog.objects.get(id=blog_id)
-        except Blog.DoesNotExist:
+        blog = get_blog(blog_id)
+        if blog is None:
             return Response({'error': 'Blog not found'}, status=status.HTTP_404_NOT_FOUND)
-        Subscription.objects.filter(user=request.user, blog=blog).delete()
+        unsubscribe(request.user, blog.id)
         return Response({'status': 'Unsubscribed'}, status=status.HTTP_204_NO_CONTENT)
 
 
@@ -257,14 +368,19 @@ class PostPublishAPIView(UpdateAPIView):
 
     def update(self, request, *args, **kwargs):
         post_id = self.kwargs['post_id']
-        post = get_object_or_404(Post, id=post_id, is_published=False)
-        if post.author != request.user:  # and request.user.is_superuser == False:
+        post = get_post(post_id)
+        if post is None or post.is_published:
+            raise Http404
+        if post.author_id != request.user.id:  # and request.user.is_superuser == False:
             return Response({'error': 'Nice try'}, status=status.HTTP_403_FORBIDDEN)
-        post.is_published = True
-        post.save()
-        blog = post.blog
-        blog.updated_at = post.created_at
-        blog.save()
+        # Один условный UPDATE: из двух одновременных публикаций пройдёт только первая
+        published_at = timezone.now()
+        if not Post.objects.using(post._state.db).filter(id=post.id, is_published=False) \
+                .update(is_published=True, created_at=published_at):
+            raise Http404
+        post_cache.invalidate(post.id)
+        schedule_blog_touch(post.blog_id, published_at, post.id)
+        schedule_post_notifications(post)
         return Response({'detail': 'Post published successfully.'})
 
 
@@ -274,20 +390,32 @@ class MyBlogListAPIView(ListAPIView):
 
     def get_queryset(self):
         user = self.request.user
-        return Blog.objects.filter(owner=user)
+        return Blog.objects.filter(owner=user, is_deleting=False)
 
 
 class BlogDetailAPIView(RetrieveDestroyAPIView):
-    queryset = Blog.objects.all()
+    queryset = Blog.objects.filter(is_deleting=False)
     serializer_class = BlogViewSerializer
     lookup_field = 'id'
     lookup_url_kwarg = 'blog_id'
 
+    def patch(self, request, *args, **kwargs):
+        instance = self.get_object()
+        if instance.owner_id != request.user.id:
+            return Response({'error': 'Only the blog owner can edit the blog'}, status=status.HTTP_403_FORBIDDEN)
+        return _save_edit(instance, request, BlogEditSerializer, BlogViewSerializer)
+
     def delete(self, request, *args, **kwargs):
         instance = self.get_object()
-        user = request.user
-        if instance.owner == user:
-            self.perform_destroy(instance)
+        if instance.owner_id == request.user.id:
+            blog_id = instance.id
+            # Большие блоги удаляются воркером пачками, а не каскадом внутри запроса
+            posts = Post.objects.using(shard_for_blog(blog_id)).filter(blog_id=blog_id)
+            if posts.count() > getattr(settings, 'BLOG_SYNC_DELETE_MAX_POSTS', 100):
+                schedule_blog_delete(blog_id)
+                return Response({'status': 'Deletion scheduled'}, status=status.HTTP_202_ACCEPTED)
+            # Та же очистка, что делает воркер: контент блога может лежать на другом шарде
+            delete_blog({'blog_id': blog_id})
             return Response({'status': 'Deleted'}, status=status.HTTP_204_NO_CONTENT)
         else:
             return Response({'error': "Access denied"}, status=status.HTTP_403_FORBIDDEN)
@@ -295,14 +423,12 @@ class BlogDetailAPIView(RetrieveDestroyAPIView):
 
 class PostListCreateAPIView(APIView):
     def get(self, request, blog_id):
-        try:
-            blog_ = Blog.objects.get(id=blog_id)
-        except Blog.DoesNotExist:
+        if get_blog(blog_id) is None:
             return Response({'error': 'Blog not found'}, status=status.HTTP_404_NOT_FOUND)
-        posts = Post.objects.filter(blog=blog_)
+        posts = Post.objects.using(shard_for_blog(blog_id)).filter(blog_id=blog_id).defer('body')
         for post in posts:
             post.increase_views()
-        serializer = PostViewSerializer(posts, many=True)
+        serializer = PostListViewSerializer(posts, many=True)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 
@@ -312,16 +438,28 @@ class PostDetailAPIView(RetrieveAPIView):
     lookup_field = 'id'
     lookup_url_kwarg = 'post_id'
 
+    def get_object(self):
+        post = get_post(self.kwargs[self.lookup_url_kwarg])
+        if post is None:
+            raise Http404
+        self.check_object_permissions(self.request, post)
+        return post
+
     def retrieve(self, request, *args, **kwargs):
         instance = self.get_object()
         instance.increase_views()
         serializer = self.get_serializer(instance)
-        return Response(serializer.data)
+        return Response(serializer.data, headers={'ETag': f'"{instance.version}"'})
+
+    def patch(self, request, *args, **kwargs):
+        instance = self.get_object()
+        if instance.author_id != request.user.id:
+            return Response({'error': 'Only the author can edit the post'}, status=status.HTTP_403_FORBIDDEN)
+        return _save_edit(instance, request, PostEditSerializer, PostViewSerializer)
 
     def delete(self, request, *args, **kwargs):
         instance = self.get_object()
-        user = request.user
-        if instance.author == user or instance.blog.owner == user:
+        if can_delete_post(request.user, instance):
             self.perform_destroy(instance)
             return Response({'status': 'Deleted'}, status=status.HTTP_204_NO_CONTENT)
         else:
@@ -333,51 +471,97 @@ class PostDetailAPIView(RetrieveAPIView):
 
 class BlogSecondDetailView(APIView):
     def get(self, request, blog_id):
-        blog = Blog.objects.get(pk=blog_id)
+        blog = get_blog(blog_id)
+        if blog is None:
+            return Response({'error': 'Blog not found'}, status=status.HTTP_404_NOT_FOUND)
         serializer = BlogSecondSerializer(blog)
         return Response(serializer.data)
 
 
 class GeneralAPIView(APIView):
+    throttle_scope = 'listing'
+
     def get(self, request):
-        N = request.query_params.get('N', 5)
-        blogs = Blog.objects.all()
-        serializer = BlogsGeneralSerializer(blogs, many=True, context={'N': int(N)})
+        N = max(int(request.query_params.get('N', 5)), 0)
+        blogs = list(Blog.objects.filter(is_deleting=False))
+        posts = _latest_posts_by_blog([blog.id for blog in blogs], N)
+        serializer = BlogsGeneralSerializer(blogs, many=True, context={'N': N, 'posts': posts})
         return Response(serializer.data)
 
 
+def _latest_posts_by_blog(blog_ids, n):
+    """First ``n`` published posts of each of ``blog_ids``: one query per shard instead of one per blog."""
+    by_shard = {}
+    for blog_id in blog_ids:
+        by_shard.setdefault(shard_for_blog(blog_id), []).append(blog_id)
+    posts_by_blog = {}
+    for alias, ids in by_shard.items():
+        posts = Post.objects.using(alias).filter(is_published=True, blog_id__in=ids)
+        if connections[alias].vendor == 'postgresql':
+            # LATERAL: по индексу (blog_id, id) читается не больше n строк каждого блога
+            table = Post._meta.db_table
+            posts = posts.filter(id__in=RawSQL(
+                f'SELECT p.id FROM unnest(%s::bigint[]) AS b(id) CROSS JOIN LATERAL ('
+                f'SELECT id FROM {table} WHERE blog_id = b.id AND is_published ORDER BY id LIMIT %s) AS p',
+                (ids, n),
+            ))
+        else:
+            # Без LATERAL (SQLite в разработке) - окно по постам только отображаемых блогов
+            rank = Window(RowNumber(), partition_by=[F('blog_id')], order_by=F('id').asc())
+            posts = posts.annotate(rank=rank).filter(rank__lte=n)
+        for post in posts.defer('body').order_by('blog_id', 'id'):
+            posts_by_blog.setdefault(post.blog_id, []).append(post)
+    return posts_by_blog
+
+
+def _exclude_deleting_blogs(posts):
+    # Блогов в очереди на удаление единицы, список берётся по частичному индексу
+    deleting = list(Blog.objects.filter(is_deleting=True).values_list('id', flat=True))
+    return posts.exclude(blog_id__in=deleting) if deleting else posts
+
+
 class UserPostsView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
         user = request.user
-        posts = Post.objects.filter(author=user).order_by("-created_at")
+        posts = _exclude_deleting_blogs(Post.objects.filter(author_id=user.id).defer('body'))
+        posts = scatter(posts, ('-created_at', '-id'))
         serializer = PostSecondSerializer(posts, many=True)
         return Response(serializer.data)
 
 
 class BlogsNewListView(APIView):
+    throttle_scope = 'listing'
     pagination_class = MyPagination
 
     def get(self, request):
-        start_date = request.query_params.get('start_date', datetime.datetime(1970, 1, 1, tzinfo=timezone.utc))
-        end_date = request.query_params.get('end_date', datetime.datetime.now(tz=timezone.utc))
-        kw = {'created_at__range': [start_date, end_date]}
+        try:
+            kw = _date_window(request)
+        except ValueError:
+            return Response({'error': 'Invalid start_date or end_date'}, status=status.HTTP_400_BAD_REQUEST)
         author = request.query_params.get('author')
         title = request.query_params.get('title')
         if title:
             kw['title__icontains'] = title
         if author:
             kw['owner__username__icontains'] = author
-        blogs = Blog.objects.filter(**kw)
+        blogs = Blog.objects.filter(is_deleting=False, **kw)
         order_by = request.GET.get('order_by', 'title')
+        if is_sharded() and order_by.lower().lstrip('-') in ['likes_count', 'relev']:
+            return Response({'error': 'Ordering by likes is not available for sharded content'},
+                            status=status.HTTP_400_BAD_REQUEST)
         if order_by.lower() in ['title', '-title', 'created_at', '-created_at']:
-            blogs = blogs.order_by(order_by.lower())
+            # id в том же направлении - стабильные страницы и проход по индексу (created_at, id)
+            blogs = blogs.order_by(order_by.lower(), '-id' if order_by.startswith('-') else 'id')
         elif order_by.lower() in ['likes_count', '-likes_count']:
-            blogs = blogs.annotate(likes_count=Count('posts__likes')).order_by(order_by.lower())
+            blogs = blogs.annotate(
+                likes_count=Count('posts__likes') + _archived_blog_total('archived_likes_count')
+            ).order_by(order_by.lower())
         elif order_by.lower() in ['relev', '-relev']:
             blogs = blogs.annotate(
                 relev=Count('posts__likes') * 2 + Count('posts__views') + Count('posts__comments') * 3
+                + _archived_blog_total('archived_likes_count') * 2 + _archived_blog_total('archived_comments_count') * 3
             ).order_by(order_by.lower())
         paginator = self.pagination_class()
         paginated_blogs = paginator.paginate_queryset(blogs, request)
@@ -387,32 +571,109 @@ class BlogsNewListView(APIView):
 
 
 class PostsListView(APIView):
+    throttle_scope = 'listing'
     pagination_class = MyPagination
 
     def get(self, request):
-        start_date = request.query_params.get('start_date', datetime.datetime(1970, 1, 1, tzinfo=timezone.utc))
-        end_date = request.query_params.get('end_date', datetime.datetime.now(tz=timezone.utc))
-        kw = {'is_published': True}
+        try:
+            kw = _date_window(request)
+        except ValueError:
+            return Response({'error': 'Invalid start_date or end_date'}, status=status.HTTP_400_BAD_REQUEST)
+        kw['is_published'] = True
         author = request.query_params.get('author')
         title = request.query_params.get('title')
         if title:
             kw['title__icontains'] = title
-        if author:
+        if author and is_sharded():
+            # Пользователи в глобальной базе: JOIN с шардом невозможен
+            kw['author_id__in'] = list(User.objects.filter(username__icontains=author).values_list('id', flat=True))
+        elif author:
             kw['author__username__icontains'] = author
-        posts = Post.objects.filter(**kw)
-        order_by = request.GET.get('order_by', 'title')
-
-        if order_by.lower() in ['title', '-title', 'created_at', '-created_at']:
-            posts = posts.order_by(order_by.lower())
-        elif order_by.lower() in ['likes_count', '-likes_count']:
-            posts = posts.annotate(likes_count=Count('posts__likes')).order_by(order_by.lower())
-        elif order_by.lower() in ['relev', '-relev']:
+        posts = _exclude_deleting_blogs(Post.objects.filter(**kw).defer('body'))
+        order_by = request.GET.get('order_by', 'title').lower()
+        if order_by in ['likes_count', '-likes_count']:
+            posts = posts.annotate(likes_count=Count('likes') + F('archived_likes_count'))
+        elif order_by in ['relev', '-relev']:
             posts = posts.annotate(
                 relev=Count('likes') * 2 + Count('views') + Count('comments') * 3
-            ).order_by(order_by.lower())
+                + F('archived_likes_count') * 2 + F('archived_comments_count') * 3
+            )
+        if order_by.lstrip('-') in ['title', 'created_at', 'likes_count', 'relev']:
+            # id в том же направлении - стабильные страницы и проход по индексу (created_at, id)
+            posts = scatter(posts, (order_by, '-id' if order_by.startswith('-') else 'id'))
+        else:
+            posts = scatter(posts)
         paginator = self.pagination_class()
         paginated_posts = paginator.paginate_queryset(posts, request)
         for post in paginated_posts:
             post.increase_views()
-        serializer = PostViewSerializer(paginated_posts, many=True)
+        serializer = PostListViewSerializer(paginated_posts, many=True)
         return paginator.get_paginated_response(serializer.data)
+
+
+class NotificationListView(ListAPIView):
+    serializer_class = NotificationSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = MyPagination
+
+    def get_queryset(self):
+        return Notification.objects.filter(user=self.request.user).select_related('blog').order_by('-created_at')
+
+
+class NotificationUnreadCountView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        return Response({'unread': unread_count(request.user)})
+
+
+class NotificationReadView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        ids = request.data.get('ids')
+        if ids is not None:
+            if isinstance(ids, str):
+                ids = ids.split(',')
+            try:
+                ids = [int(i) for i in ids]
+            except (TypeError, ValueError):
+                return Response({'error': 'Invalid ids'}, status=status.HTTP_400_BAD_REQUEST)
+        updated = mark_read(request.user, ids)
+        return Response({'marked_read': updated, 'unread': unread_count(request.user)})
+
+
+class BlogStatsView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, blog_id):
+        if not blog_exists(blog_id):
+            return Response({'error': 'Blog not found'}, status=status.HTTP_404_NOT_FOUND)
+        if not can_admin_blog(request.user, blog_id):
+            return Response({'error': 'Only the blog owner can see stats'}, status=status.HTTP_403_FORBIDDEN)
+        try:
+            end = _query_date(request, 'end_date') or timezone.localdate()
+            start = _query_date(request, 'start_date') or end - datetime.timedelta(days=29)
+        except ValueError:
+            return Response({'error': 'Dates must be in YYYY-MM-DD format'}, status=status.HTTP_400_BAD_REQUEST)
+        if start > end:
+            return Response({'error': 'start_date is after end_date'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(blog_stats(blog_id, start, end))
+
+
+class BlogSubscribersView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, blog_id):
+        blog = get_blog(blog_id)
+        if blog is None:
+            return Response({'error': 'Blog not found'}, status=status.HTTP_404_NOT_FOUND)
+        if not can_admin_blog(request.user, blog.id):
+            return Response({'error': 'Only the blog owner can see subscribers'}, status=status.HTTP_403_FORBIDDEN)
+        subscribers = Subscription.objects.filter(blog_id=blog.id).select_related('user') \
+            .only('id', 'created_at', 'user__username')
+        paginator = SubscribersPagination()
+        page = paginator.paginate_queryset(subscribers, request, view=self)
+        response = paginator.get_paginated_response(SubscriberSerializer(page, many=True).data)
+        response.data['subscribers_count'] = blog.subscribers_count
+        return response